@@ -0,0 +1,20 @@
+"""
+The repository's gunicorn.conf.py plus a fixed delay before every SQL statement, standing
+in for the network round trip to a database on another host (SQLite answers in
+microseconds, which hides what a worker does while it waits). Used by
+`benchmarks/run.py --db-latency-ms`.
+"""
+import os
+import time
+
+# gunicorn reads every module-level name matching a setting, so don't call this `config`
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gunicorn.conf.py')) as base:
+    exec(base.read())
+
+
+def post_worker_init(worker):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    delay = float(os.getenv('BENCH_DB_LATENCY_MS', 0)) / 1000
+    event.listen(Engine, 'before_cursor_execute', lambda *args: time.sleep(delay))
@@ -0,0 +1,89 @@
+"""
+Cost of building and encoding a large /characters response, before and after the
+row-based serializers and the orjson provider.
+
+    $ python benchmarks/json_encoding.py --characters 100000
+
+before:  ORM instances (load_options) -> serialize() dicts -> stdlib json
+rows:    row_query() tuples -> dataclass rows -> stdlib json (the fallback without orjson)
+after:   row_query() tuples -> dataclass rows -> orjson
+
+Then the routes themselves through the test client: one page holding every row
+(MAX_PAGE_SIZE is raised for the run) and the NDJSON export.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'src'))
+
+from seed import seed
+
+
+def timed(function, repeat):
+    timings = []
+    size = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--characters', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'json_bench.db')
+    seed(url, planets=1000, characters=args.characters, vehicles=0, users=1, favorites=0)
+    os.environ['DATABASE_URL'] = url
+    os.environ['MAX_PAGE_SIZE'] = str(args.characters)
+    os.environ['CACHE_TTL'] = '0'
+
+    import json_provider
+    from flask.json.provider import DefaultJSONProvider
+    from app import app
+    from models import Character
+
+    stdlib = DefaultJSONProvider(app)
+    fast = json_provider.FastJSONProvider(app)
+    orjson = json_provider.orjson
+
+    def before():
+        characters = Character.query.options(*Character.load_options()).order_by(Character.id).all()
+        return len(stdlib.dumps({'results': [character.serialize() for character in characters]}))
+
+    def rows(provider):
+        def run():
+            rows = Character.row_query(Character.query).order_by(Character.id).all()
+            return len(provider.dumps({'results': Character.serialize_rows(rows)}))
+        return run
+
+    with app.app_context():
+        print(f'{args.characters} characters, median of {args.repeat} runs')
+        results = [('before (ORM + serialize + stdlib)', timed(before, args.repeat))]
+        json_provider.orjson = None
+        results.append(('rows + stdlib', timed(rows(fast), args.repeat)))
+        json_provider.orjson = orjson
+        if orjson is not None:
+            results.append(('after (rows + orjson)', timed(rows(fast), args.repeat)))
+        for name, (ms, size) in results:
+            print(f'  {name:<40}{ms:>10.1f}ms{size / 1024 / 1024:>8.1f}MB')
+
+    client = app.test_client()
+    print('routes (test client)')
+    for path in (f'/characters?limit={args.characters}', '/characters?stream=1'):
+        for name, provider in (('stdlib', stdlib), ('current', fast)):
+            app.json = provider
+            ms, size = timed(lambda: len(client.get(path).get_data()), args.repeat)
+            print(f'  {path:<30}{name:<10}{ms:>10.1f}ms{size / 1024 / 1024:>8.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
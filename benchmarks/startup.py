@@ -0,0 +1,76 @@
+"""
+Worker boot cost: time and memory to import src/wsgi.py, per ADMIN_MODE, plus the
+import time of each package from `python -X importtime`.
+
+    $ python benchmarks/startup.py
+    $ python benchmarks/startup.py --runs 20 --top 25
+
+Every run is a fresh interpreter, like a gunicorn worker booting without --preload.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+MODES = ('eager', 'lazy', 'off')
+
+PROBE = (
+    'import resource, time\n'
+    'start = time.perf_counter()\n'
+    'import wsgi\n'
+    'print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n'
+)
+
+
+def environment(mode):
+    env = dict(os.environ)
+    env['ADMIN_MODE'] = mode
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'startup_bench.db'))
+    return env
+
+
+def boot(mode):
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=SRC, env=environment(mode),
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]) * 1000, int(output[1]) / 1024
+
+
+def import_times(mode):
+    """Self time in milliseconds spent importing each top-level package, from -X importtime."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import wsgi'], cwd=SRC,
+                            env=environment(mode), capture_output=True, text=True, check=True).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, _, module = line[len('import time:'):].split('|')
+        package = module.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1000
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='interpreters started per mode')
+    parser.add_argument('--top', type=int, default=15, help='packages listed per mode')
+    args = parser.parse_args()
+
+    print(f"{'ADMIN_MODE':<12}{'import p50':>12}{'min':>10}{'max RSS':>12}")
+    for mode in MODES:
+        runs = [boot(mode) for _ in range(args.runs)]
+        timings = [ms for ms, _ in runs]
+        print(f'{mode:<12}{statistics.median(timings):>10.0f}ms{min(timings):>8.0f}ms'
+              f'{statistics.median(rss for _, rss in runs):>10.1f}MB')
+
+    for mode in MODES:
+        packages = import_times(mode)
+        print(f'\nimport time by package with ADMIN_MODE={mode} ({sum(packages.values()):.0f}ms in total)')
+        for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'  {ms:>8.1f}ms  {package}')
+
+
+if __name__ == '__main__':
+    main()
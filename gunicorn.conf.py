@@ -0,0 +1,81 @@
+"""
+Gunicorn settings for the web process (Procfile / render.yaml).
+
+Threaded workers (gthread): each worker serves GUNICORN_THREADS requests at once, so a
+worker waiting on a database round trip no longer blocks every other client it holds.
+This is safe for the app: Flask-SQLAlchemy scopes its session to the app context (one
+per request and thread), and the process-wide state (response cache, metrics, SQLite
+cache connections) is locked or thread-local.
+
+    WEB_CONCURRENCY   workers, defaults to CPU count + 1
+    GUNICORN_THREADS  threads per worker, defaults to 2 * CPU count (at least 4)
+
+The CPU count is the CPUs this process may run on, capped by the container's cgroup CPU
+quota: a container sees every core of the host in os.cpu_count().
+
+Every worker has its own connection pool. A thread holds at most one connection, so by
+default DB_POOL_SIZE + DB_MAX_OVERFLOW add up to the threads: the pool keeps them all
+unless DB_POOL_SIZE is set lower, and the overflow covers the rest. Keep
+workers * threads under the database's connection limit. The app is not preloaded:
+engines and cache connections must be created after the fork, in each worker.
+
+The response cache has to be shared by the workers, or a write only invalidates the one
+that served it while the others keep serving the old body (under the new ETag) for
+CACHE_TTL. CACHE_URL defaults to a SQLite file per gunicorn master, removed on exit;
+an explicit memory:// with more than one worker turns the cache off instead.
+"""
+import math
+import os
+import tempfile
+
+def cgroup_cpu_limit():
+    """The cgroup CPU quota in whole CPUs (v2 cpu.max, or v1 cfs quota/period), None if unlimited."""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f, open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as g:
+                quota, period = f.read().strip(), g.read().strip()
+        except OSError:
+            return None
+    if quota in ('max', '-1'):
+        return None
+    return max(1, math.ceil(int(quota) / int(period)))
+
+def available_cpus():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+    return min(cpus, limit) if limit else cpus
+
+cpus = available_cpus()
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', cpus + 1))
+threads = int(os.getenv('GUNICORN_THREADS', max(4, cpus * 2)))
+
+# read by database.engine_options() when the workers import the app
+pool_size = int(os.environ.setdefault('DB_POOL_SIZE', str(threads)))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(max(0, threads - pool_size)))
+
+# read by cache.configure_cache(), likewise
+cache_file = os.path.join(tempfile.gettempdir(), f'api-cache-{os.getpid()}.db')
+os.environ.setdefault('CACHE_URL', 'sqlite:///' + cache_file)
+if workers > 1 and os.environ['CACHE_URL'].startswith('memory:'):
+    os.environ['CACHE_TTL'] = '0'
+
+def on_exit(server):
+    if os.environ['CACHE_URL'] == 'sqlite:///' + cache_file:
+        for path in (cache_file, cache_file + '-wal', cache_file + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+# idle keep-alive connections hold a thread only between requests, not during them
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# backlog of accepted connections queued while every thread is busy
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
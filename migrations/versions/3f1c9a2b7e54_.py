@@ -0,0 +1,51 @@
+"""favorites indexes and uniqueness
+
+Revision ID: 3f1c9a2b7e54
+Revises: 0acc6de04600
+Create Date: 2026-10-18 10:12:41.583208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a2b7e54'
+down_revision = '0acc6de04600'
+branch_labels = None
+depends_on = None
+
+
+FAVORITE_COLUMNS = ('character_id', 'planet_id', 'vehicle_id')
+
+
+def upgrade():
+    # drop duplicated favorites (keeping the oldest row) so the unique indexes can be built
+    for column in FAVORITE_COLUMNS:
+        op.execute(
+            f"DELETE FROM favorites WHERE {column} IS NOT NULL AND id NOT IN ("
+            f"SELECT MIN(id) FROM favorites WHERE {column} IS NOT NULL GROUP BY user_id, {column})"
+        )
+
+    # per-user listing (the partial indexes below can't serve a bare user_id filter)
+    op.create_index('ix_favorites_user_id', 'favorites', ['user_id'], unique=False)
+
+    # (user_id, <kind>_id) serves the lookups done on delete and rejects duplicates;
+    # the partial WHERE keeps every index limited to the rows of its own kind
+    for column in FAVORITE_COLUMNS:
+        kind = column[:-len('_id')]
+        op.create_index(
+            f'ix_favorites_user_{kind}',
+            'favorites',
+            ['user_id', column],
+            unique=True,
+            postgresql_where=sa.text(f'{column} IS NOT NULL'),
+            sqlite_where=sa.text(f'{column} IS NOT NULL'),
+        )
+
+
+def downgrade():
+    for column in reversed(FAVORITE_COLUMNS):
+        kind = column[:-len('_id')]
+        op.drop_index(f'ix_favorites_user_{kind}', table_name='favorites')
+    op.drop_index('ix_favorites_user_id', table_name='favorites')
@@ -0,0 +1,35 @@
+"""table_version for conditional GETs
+
+Revision ID: 8b2d4e6f1a37
+Revises: 3f1c9a2b7e54
+Create Date: 2026-10-18 11:40:03.118925
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a37'
+down_revision = '3f1c9a2b7e54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    now = datetime.utcnow()
+    op.bulk_insert(table_version, [
+        {'table_name': name, 'version': 1, 'updated_at': now}
+        for name in ('user', 'planet', 'character', 'vehicle', 'favorites')
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
@@ -0,0 +1,38 @@
+"""catalog filter and sort indexes
+
+Revision ID: c5e7a9d3b281
+Revises: 8b2d4e6f1a37
+Create Date: 2026-10-18 14:05:52.730114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e7a9d3b281'
+down_revision = '8b2d4e6f1a37'
+branch_labels = None
+depends_on = None
+
+
+# every index ends in id so keyset pagination on (column, id) is a plain range scan
+INDEXES = [
+    ('ix_planet_climate_id', 'planet', ['climate', 'id']),
+    ('ix_planet_diameter_id', 'planet', ['diameter', 'id']),
+    ('ix_character_gender_id', 'character', ['gender', 'id']),
+    ('ix_character_planet_id_id', 'character', ['planet_id', 'id']),
+    ('ix_character_height_id', 'character', ['height', 'id']),
+    ('ix_vehicle_pilot_id_id', 'vehicle', ['pilot_id', 'id']),
+    ('ix_vehicle_passengers_id', 'vehicle', ['passengers', 'id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,61 @@
+"""full-text search indexes
+
+Revision ID: e4a61f0c9d52
+Revises: c5e7a9d3b281
+Create Date: 2026-10-18 15:31:27.416903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a61f0c9d52'
+down_revision = 'c5e7a9d3b281'
+branch_labels = None
+depends_on = None
+
+
+# SQLite: rowid of search_index = entity id * 4 + kind code
+KIND_CODES = {'planet': 1, 'character': 2, 'vehicle': 3}
+POSTGRESQL_DOCUMENT = "to_tsvector('english', name || ' ' || description)"
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for kind in KIND_CODES:
+            op.execute(f'CREATE INDEX ix_{kind}_search ON "{kind}" USING gin ({POSTGRESQL_DOCUMENT})')
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE search_index USING fts5(name, description, tokenize='porter unicode61')")
+        for kind, code in KIND_CODES.items():
+            row = f"new.id * 4 + {code}, new.name, new.description"
+            op.execute(
+                f"CREATE TRIGGER {kind}_search_insert AFTER INSERT ON {kind} BEGIN "
+                f"INSERT INTO search_index (rowid, name, description) VALUES ({row}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {kind}_search_update AFTER UPDATE OF id, name, description ON {kind} BEGIN "
+                f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code}; "
+                f"INSERT INTO search_index (rowid, name, description) VALUES ({row}); END"
+            )
+            op.execute(
+                f"CREATE TRIGGER {kind}_search_delete AFTER DELETE ON {kind} BEGIN "
+                f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code}; END"
+            )
+            op.execute(
+                f"INSERT INTO search_index (rowid, name, description) "
+                f"SELECT id * 4 + {code}, name, description FROM {kind}"
+            )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for kind in KIND_CODES:
+            op.execute(f'DROP INDEX ix_{kind}_search')
+    elif dialect == 'sqlite':
+        for kind in KIND_CODES:
+            for action in ('insert', 'update', 'delete'):
+                op.execute(f'DROP TRIGGER {kind}_search_{action}')
+        op.execute('DROP TABLE search_index')
@@ -0,0 +1,64 @@
+"""favorite counters on planets, characters and vehicles, favorites by entity, their table_version rows
+
+Revision ID: f3b8c1d6e2a9
+Revises: e4a61f0c9d52
+Create Date: 2026-10-18 17:12:44.530218
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8c1d6e2a9'
+down_revision = 'e4a61f0c9d52'
+branch_labels = None
+depends_on = None
+
+
+# counted table -> its column in favorites
+KINDS = {'planet': 'planet_id', 'character': 'character_id', 'vehicle': 'vehicle_id'}
+# the versions favorite_count changes bump (models.counts_tag())
+COUNT_VERSIONS = [f'{kind}_favorites' for kind in KINDS]
+
+table_version = sa.table('table_version',
+    sa.column('table_name', sa.String),
+    sa.column('version', sa.Integer),
+    sa.column('updated_at', sa.DateTime),
+)
+
+
+def upgrade():
+    # favorites by entity: the backfill below, `flask reconcile-favorites` and the
+    # cleanup when an entity is deleted all look favorites up this way
+    for kind, column in KINDS.items():
+        op.create_index(
+            f'ix_favorites_{column}',
+            'favorites',
+            [column],
+            unique=False,
+            postgresql_where=sa.text(f'{column} IS NOT NULL'),
+            sqlite_where=sa.text(f'{column} IS NOT NULL'),
+        )
+
+    # plain ALTERs, not batch mode: recreating the SQLite tables would drop their search triggers
+    for kind, column in KINDS.items():
+        op.add_column(kind, sa.Column('favorite_count', sa.Integer(), nullable=False, server_default='0'))
+        op.create_index(f'ix_{kind}_favorite_count_id', kind, ['favorite_count', 'id'], unique=False)
+        op.execute(
+            f'UPDATE "{kind}" SET favorite_count = '
+            f'(SELECT COUNT(*) FROM favorites WHERE favorites.{column} = "{kind}".id)'
+        )
+
+    now = datetime.utcnow()
+    op.bulk_insert(table_version, [{'table_name': name, 'version': 1, 'updated_at': now} for name in COUNT_VERSIONS])
+
+
+def downgrade():
+    op.execute(table_version.delete().where(table_version.c.table_name.in_(COUNT_VERSIONS)))
+    for kind in KINDS:
+        op.drop_index(f'ix_{kind}_favorite_count_id', table_name=kind)
+        op.drop_column(kind, 'favorite_count')
+    for column in KINDS.values():
+        op.drop_index(f'ix_favorites_{column}', table_name='favorites')
@@ -1,14 +1,19 @@
 import os
-from flask_admin import Admin
+import threading
+from flask import Flask
+from cache import configure_cache, response_cache
+from database import configure_database
 from models import db, User, Planet, Character, Vehicle, Favorites
-from flask_admin.contrib.sqla import ModelView
 
 def setup_admin(app):
+    # imported here so web workers that never serve /admin don't pay for flask_admin
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
     # Add your models here, for example this is how we add a the User model to the admin
     admin.add_view(ModelView(User, db.session))
     admin.add_view(ModelView(Favorites, db.session))
@@ -17,4 +22,56 @@ def setup_admin(app):
     admin.add_view(ModelView(Vehicle, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
+
+def create_admin_app(standalone=False):
+    """
+    A Flask app serving only /admin, on the same database as the API. Standalone (its own
+    process, see admin_wsgi.py) it also connects the response cache to CACHE_URL, so its
+    commits invalidate the API's entries; inside the API process the cache is already set up.
+    """
+    admin_app = Flask(__name__)
+    configure_database(admin_app)
+    db.init_app(admin_app)
+    if standalone:
+        configure_cache(admin_app)
+        response_cache.init_app(admin_app)
+    setup_admin(admin_app)
+    return admin_app
+
+class LazyAdmin:
+    """WSGI middleware sending /admin to an admin app that is only built on its first request."""
+
+    def __init__(self, app, prefix='/admin'):
+        self.app = app
+        self.prefix = prefix
+        self._admin_app = None
+        self._lock = threading.Lock()
+
+    def admin_app(self):
+        if self._admin_app is None:
+            with self._lock:
+                if self._admin_app is None:
+                    self._admin_app = create_admin_app()
+        return self._admin_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == self.prefix or path.startswith(self.prefix + '/'):
+            return self.admin_app()(environ, start_response)
+        return self.app(environ, start_response)
+
+def init_admin(app):
+    """
+    ADMIN_MODE picks how the admin UI is served:
+    lazy   (default) built on the first /admin request, so workers boot without it
+    eager  registered on the app at import, as it used to be
+    off    not served by the API; run `gunicorn admin_wsgi --chdir ./src/` separately
+    """
+    app.config['ADMIN_MODE'] = os.getenv("ADMIN_MODE", "lazy")
+    if app.config['ADMIN_MODE'] == 'eager':
+        setup_admin(app)
+    elif app.config['ADMIN_MODE'] == 'lazy':
+        app.wsgi_app = LazyAdmin(app.wsgi_app)
+    elif app.config['ADMIN_MODE'] != 'off':
+        raise ValueError(f"ADMIN_MODE must be lazy, eager or off, not {app.config['ADMIN_MODE']}")
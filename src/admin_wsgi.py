@@ -0,0 +1,11 @@
+# The admin UI as its own process, for deployments running the API with ADMIN_MODE=off:
+#   gunicorn admin_wsgi --chdir ./src/
+# Give it the API's CACHE_URL: its edits invalidate cached API responses through that
+# backend, which the default memory:// (private to each process) can't share.
+
+from admin import create_admin_app
+
+application = create_admin_app(standalone=True)
+
+if __name__ == "__main__":
+    application.run()
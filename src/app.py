@@ -6,75 +6,113 @@ from flask import Flask, request, jsonify, url_for
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
-from admin import setup_admin
+from sqlalchemy.exc import IntegrityError
+from search import SEARCHABLE, search
+from utils import (APIException, Sitemap, apply_filters, expand_rows, expansion_columns, fetch_by_ids, get_expand,
+                   get_fields, get_ids, get_page_size, paginate, request_tables, serialize_rows, stream_ndjson,
+                   wants_ndjson)
+from admin import init_admin
+from bulk import bulk_delete, bulk_upsert
+from cache import add_cache_tags, cached, configure_cache, response_cache
+from compression import init_compression
+from conditional import conditional_get
+from database import check_database, configure_database, pool_stats
+from favorites import (COUNT_TAGS as FAVORITE_COUNT_TAGS, KINDS as FAVORITE_KINDS, insert_favorite, most_favorited,
+                       reconcile_command, remove_favorites, remove_favorites_of)
+from json_provider import FastJSONProvider
+from metrics import init_metrics
+from querylog import init_query_log, query_budget
 from models import db, User, Planet, Character, Vehicle, Favorites
 
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.json = FastJSONProvider(app)
+
+configure_database(app)
+configure_cache(app)
+app.config['PAGE_SIZE'] = int(os.getenv("PAGE_SIZE", 50))
+app.config['MAX_PAGE_SIZE'] = int(os.getenv("MAX_PAGE_SIZE", 100))
+app.config['SEARCH_MAX_RESULTS'] = int(os.getenv("SEARCH_MAX_RESULTS", 100))
+app.config['BATCH_MAX_IDS'] = int(os.getenv("BATCH_MAX_IDS", 100))
+app.config['STREAM_BATCH_SIZE'] = int(os.getenv("STREAM_BATCH_SIZE", 1000))
+app.config['BULK_CHUNK_SIZE'] = int(os.getenv("BULK_CHUNK_SIZE", 500))
+app.config['BULK_MAX_CHUNK_SIZE'] = int(os.getenv("BULK_MAX_CHUNK_SIZE", 5000))
+app.config['SITEMAP_MAX_AGE'] = int(os.getenv("SITEMAP_MAX_AGE", 300))
 
 MIGRATE = Migrate(app, db)
 db.init_app(app)
 CORS(app)
-setup_admin(app)
+response_cache.init_app(app)
+init_metrics(app)
+init_compression(app)
+init_query_log(app)
+init_admin(app)
+app.cli.add_command(reconcile_command)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
-# generate sitemap with all your endpoints
+# sitemap with all your endpoints, rendered once at startup (see SITEMAP at the bottom)
 @app.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return SITEMAP.html_response()
+
+@app.route('/sitemap.json', methods=['GET'])
+def sitemap_json():
+    return SITEMAP.json_response()
+
+# liveness for load balancers: no templates, no database
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return 'ok', 200, {'Content-Type': 'text/plain', 'Cache-Control': 'no-store'}
+
+# database reachability and connection pool usage, to size DB_POOL_SIZE/DB_MAX_OVERFLOW
+@app.route('/health/db', methods=['GET'])
+def health_db():
+    replicas = {key: pool_stats(engine) for key, engine in db.engines.items() if key is not None}
+    try:
+        latency_ms = check_database(db.engine)
+    except Exception:
+        # the driver's message can name the host, port, user and SQL: keep it in the logs
+        app.logger.exception('Database health check failed')
+        return jsonify({'status': 'unavailable', 'pool': pool_stats(db.engine), 'replicas': replicas}), 503
+    return jsonify({'status': 'ok', 'latency_ms': latency_ms, 'pool': pool_stats(db.engine), 'replicas': replicas}), 200
+
+# cache counters, to size CACHE_MAX_ENTRIES/CACHE_TTL
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(response_cache.stats()), 200
 
 # USERS ENDPOINTS
 # -----------------------------------Get All Users--------------------------------
 @app.route('/users', methods=['GET'])
+@query_budget(2)
+@conditional_get('user')
 def get_users():
-    users = User.query.all()
-    serialized_users = [user.serialize() for user in users]
+    fields = get_fields(User)
+    query = User.row_query(User.query, fields)
+    if wants_ndjson():
+        return stream_ndjson(query, User, fields)
 
-    if users is None:
-        return jsonify({'error':'No users found'}), 404
-    else:
-        return jsonify(serialized_users), 200
+    users, next_url = paginate(query, User)
+
+    return jsonify({'results': User.serialize_rows(users, fields), 'next': next_url}), 200
 
 
 # FAVORITES ENDPOINTS
 # -----------------------------------Get All Favorites of a User--------------------------------
 @app.route('/users/<int:user_id>/favorites', methods=['GET'])
+@query_budget(3)
+@conditional_get('favorites', 'character', 'planet', 'vehicle')
 def get_favorites(user_id):
     user = User.query.get(user_id)
     if user is None:
         return jsonify({'error':'User not found'}), 404
     
-    favorites = Favorites.query.filter_by(user_id=user_id).all()
-    
-    if favorites is None:
-        return jsonify({'error':'Favorites not found for this user'}), 404
-    else:
-        combined_favorites = {
-        "favorite_characters": [],
-        "favorite_planets": [],
-        "favorite_vehicles": []
-    }
-        for favorite in favorites:
-            if favorite.character:
-                combined_favorites["favorite_characters"].append(favorite.character.name)
-            if favorite.planet:
-                combined_favorites["favorite_planets"].append(favorite.planet.name)
-            if favorite.vehicle:
-                combined_favorites["favorite_vehicles"].append(favorite.vehicle.name)
-        return jsonify(combined_favorites), 200
+    return jsonify(Favorites.serialize_for_user(user_id)), 200
 
 # ---------------------Add Favorite Planet/Character/Vehicle to a User-------------------------
 @app.route('/favorites/user/<int:user_id>', methods=['POST'])
@@ -90,8 +128,12 @@ def add_favorite(user_id):
     favorites.planet_id = body.get('planet_id')
     favorites.vehicle_id = body.get('vehicle_id')
 
-    db.session.add(favorites)
-    db.session.commit()
+    try:
+        insert_favorite(favorites)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error':'Favorite already exists or references a missing entity'}), 409
 
     return jsonify({'msg':'Favorites have been updated successfully'}), 200
 
@@ -111,34 +153,88 @@ def delete_favorite(user_id, id, type):
         favorite_entry = Favorites.query.filter_by(user_id=user_id, vehicle_id=id).first()
 
     if favorite_entry:
-        db.session.delete(favorite_entry)
+        remove_favorites([favorite_entry])
         db.session.commit()
         return jsonify({'msg':f'Favorite {type} deleted successfully'}), 200
     else:
         return jsonify({'error':f'Favorite {type} not found'}), 404
 
+# -----------------------------------Most Favorited Planets/Characters/Vehicles--------------------------------
+@app.route('/favorites/top', methods=['GET'])
+@query_budget(2)
+@conditional_get('character', 'planet', 'vehicle', *FAVORITE_COUNT_TAGS)
+@cached('character', 'planet', 'vehicle', *FAVORITE_COUNT_TAGS)
+def get_top_favorites():
+    type = request.args.get('type')
+    if type not in FAVORITE_KINDS:
+        return jsonify({'error':f"type must be one of {', '.join(FAVORITE_KINDS)}"}), 400
+
+    model = FAVORITE_KINDS[type][0]
+    fields = get_fields(model)
+    rows = most_favorited(type, fields).limit(get_page_size()).all()
+
+    return jsonify({'results': serialize_rows(model, rows, fields)}), 200
+
 
 # CHARACTERS ENDPOINTS
 # -----------------------------------Get All Characters--------------------------------
 @app.route('/characters', methods=['GET'])
+@query_budget(4)
+@conditional_get('character', 'planet', depends=request_tables(Character))
+@cached('character', 'planet')
 def get_characters():
-    characters = Character.query.all()
-    serialized_characters = [character.serialize() for character in characters]
+    fields = get_fields(Character)
+    expand = get_expand(Character)
+    query = Character.row_query(apply_filters(Character.query, Character), fields, expansion_columns(Character, expand))
+    ids = get_ids()
+    if wants_ndjson():
+        return stream_ndjson(query, Character, fields, expand, ids=ids)
 
-    if characters is None:
-        return jsonify({'error':'No characters found'}), 404
-    else:
-        return jsonify(serialized_characters), 200
+    if ids is not None:
+        characters, missing = fetch_by_ids(query, Character, ids)
+        return jsonify({'results': serialize_rows(Character, characters, fields, expand), 'missing': missing}), 200
+
+    characters, next_url = paginate(query, Character)
+
+    return jsonify({'results': serialize_rows(Character, characters, fields, expand), 'next': next_url}), 200
 
 # -----------------------------------Get a Character--------------------------------
 @app.route('/characters/<int:character_id>', methods=['GET'])
+@query_budget(4)
+@conditional_get('character', 'planet', depends=request_tables(Character))
+@cached('character')
 def get_character(character_id):
-    character = Character.query.get(character_id)
-
-    if character is None:
+    fields = get_fields(Character)
+    expand = get_expand(Character)
+    if not expand:
+        character = Character.query.options(*Character.load_options(fields)).get(character_id)
+        if character is None:
+            return jsonify({'error': 'Character not found'}), 404
+        if (fields is None or 'homeworld' in fields) and character.planet_id is not None:
+            add_cache_tags(f'planet:{character.planet_id}')
+        return jsonify(character.serialize(fields)), 200
+
+    query = Character.query.filter(Character.id == character_id)
+    row = Character.row_query(query, fields, expansion_columns(Character, expand)).first()
+    if row is None:
+        return jsonify({'error': 'Character not found'}), 404
+    return jsonify(expand_rows(Character, [row], fields, expand)[0]), 200
+
+# -----------------------------------Get a Character's Vehicles--------------------------------
+@app.route('/characters/<int:character_id>/vehicles', methods=['GET'])
+@query_budget(3)
+@conditional_get('character', 'vehicle', depends=request_tables(Vehicle))
+@cached('character')
+def get_character_vehicles(character_id):
+    if db.session.query(Character.id).filter_by(id=character_id).first() is None:
         return jsonify({'error': 'Character not found'}), 404
-    else:
-        return jsonify(character.serialize()), 200
+
+    fields = get_fields(Vehicle)
+    query = Vehicle.row_query(apply_filters(Vehicle.query.filter(Vehicle.pilot_id == character_id), Vehicle), fields)
+    vehicles, next_url = paginate(query, Vehicle)
+    add_cache_tags('vehicle')
+
+    return jsonify({'results': serialize_rows(Vehicle, vehicles, fields), 'next': next_url}), 200
 
 # -----------------------------------Add a Character--------------------------------
 @app.route('/characters', methods=['POST'])
@@ -181,12 +277,23 @@ def update_character(character_id):
 
     return jsonify("Character has been updated successfully", character.serialize()), 200
 
+# -----------------------------------Bulk Add/Update Characters--------------------------------
+@app.route('/characters/bulk', methods=['POST'])
+def bulk_upsert_characters():
+    return jsonify(bulk_upsert(Character)), 200
+
+# -----------------------------------Bulk Delete Characters--------------------------------
+@app.route('/characters/bulk', methods=['DELETE'])
+def bulk_delete_characters():
+    return jsonify(bulk_delete(Character)), 200
+
 # -----------------------------------Delete a Character--------------------------------
 @app.route('/characters/<int:character_id>', methods=['DELETE'])
 def delete_character(character_id):
     character = Character.query.filter_by(id=character_id).first()
     
     if character:
+        remove_favorites_of(Character, [character_id])
         db.session.delete(character)
         db.session.commit()
         return jsonify("Character deleted successfully"), 200
@@ -197,24 +304,46 @@ def delete_character(character_id):
 # PLANETS ENDPOINTS
 # -----------------------------------Get All Planets--------------------------------
 @app.route('/planets', methods=['GET'])
+@query_budget(3)
+@conditional_get('planet', depends=request_tables(Planet))
+@cached('planet')
 def get_planets():
-    planets = Planet.query.all()
-    serialized_planets = [planet.serialize() for planet in planets]
+    fields = get_fields(Planet)
+    expand = get_expand(Planet)
+    query = Planet.row_query(apply_filters(Planet.query, Planet), fields, expansion_columns(Planet, expand))
+    ids = get_ids()
+    if wants_ndjson():
+        return stream_ndjson(query, Planet, fields, expand, ids=ids)
 
-    if planets is None:
-        return jsonify({'error':'No planets found'}), 404
-    else:
-        return jsonify(serialized_planets), 200
+    if ids is not None:
+        planets, missing = fetch_by_ids(query, Planet, ids)
+        return jsonify({'results': serialize_rows(Planet, planets, fields, expand), 'missing': missing}), 200
+
+    planets, next_url = paginate(query, Planet)
+
+    return jsonify({'results': serialize_rows(Planet, planets, fields, expand), 'next': next_url}), 200
 
 # -----------------------------------Get a Planet--------------------------------
 @app.route('/planets/<int:planet_id>', methods=['GET'])
+@query_budget(3)
+@conditional_get('planet', depends=request_tables(Planet))
+@cached('planet')
 def get_planet(planet_id):
-    planet = Planet.query.get(planet_id)
+    fields = get_fields(Planet)
+    expand = get_expand(Planet)
+    if expand:
+        query = Planet.query.filter(Planet.id == planet_id)
+        row = Planet.row_query(query, fields, expansion_columns(Planet, expand)).first()
+        if row is None:
+            return jsonify({'error':'Planet not found'}), 404
+        return jsonify(expand_rows(Planet, [row], fields, expand)[0]), 200
+
+    planet = Planet.query.options(*Planet.load_options(fields)).get(planet_id)
     
     if planet is None:
         return jsonify({'error':'Planet not found'}), 404
     else:
-        return jsonify(planet.serialize()), 200
+        return jsonify(planet.serialize(fields)), 200
 
 # -----------------------------------Add a Planet--------------------------------
 @app.route('/planets', methods=['POST'])
@@ -257,12 +386,23 @@ def update_planet(planet_id):
 
     return jsonify("Planet has been updated successfully", planet.serialize()), 200
 
+# -----------------------------------Bulk Add/Update Planets--------------------------------
+@app.route('/planets/bulk', methods=['POST'])
+def bulk_upsert_planets():
+    return jsonify(bulk_upsert(Planet)), 200
+
+# -----------------------------------Bulk Delete Planets--------------------------------
+@app.route('/planets/bulk', methods=['DELETE'])
+def bulk_delete_planets():
+    return jsonify(bulk_delete(Planet)), 200
+
 # -----------------------------------Delete a Planet--------------------------------
 @app.route('/planets/<int:planet_id>', methods=['DELETE'])
 def delete_planet(planet_id):
     planet = Planet.query.filter_by(id=planet_id).first()
     
     if planet:
+        remove_favorites_of(Planet, [planet_id])
         db.session.delete(planet)
         db.session.commit()
         return jsonify("Planet deleted successfully"), 200
@@ -273,24 +413,39 @@ def delete_planet(planet_id):
 # VEHICLES ENDPOINTS
 # -----------------------------------Get All Vehicles--------------------------------
 @app.route('/vehicles', methods=['GET'])
+@query_budget(2)
+@conditional_get('vehicle', 'character', depends=request_tables(Vehicle))
+@cached('vehicle', 'character')
 def get_vehicles():
-    vehicles = Vehicle.query.all()
-    serialized_vehicles = [vehicle.serialize() for vehicle in vehicles]
+    fields = get_fields(Vehicle)
+    query = Vehicle.row_query(apply_filters(Vehicle.query, Vehicle), fields)
+    ids = get_ids()
+    if wants_ndjson():
+        return stream_ndjson(query, Vehicle, fields, ids=ids)
 
-    if vehicles is None:
-        return jsonify({'error':'No vehicles found'}), 404
-    else:
-        return jsonify(serialized_vehicles), 200
+    if ids is not None:
+        vehicles, missing = fetch_by_ids(query, Vehicle, ids)
+        return jsonify({'results': serialize_rows(Vehicle, vehicles, fields), 'missing': missing}), 200
+
+    vehicles, next_url = paginate(query, Vehicle)
+
+    return jsonify({'results': serialize_rows(Vehicle, vehicles, fields), 'next': next_url}), 200
 
 # -----------------------------------Get a Vehicle--------------------------------
 @app.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@query_budget(2)
+@conditional_get('vehicle', 'character', depends=request_tables(Vehicle))
+@cached('vehicle')
 def get_vehicle(vehicle_id):
-    vehicle = Vehicle.query.get(vehicle_id)
+    fields = get_fields(Vehicle)
+    vehicle = Vehicle.query.options(*Vehicle.load_options(fields)).get(vehicle_id)
     
     if vehicle is None:
         return jsonify({'error':'Vehicle not found'}), 404
     else:
-        return jsonify(vehicle.serialize()), 200
+        if (fields is None or 'pilot_id' in fields) and vehicle.pilot_id is not None:
+            add_cache_tags(f'character:{vehicle.pilot_id}')
+        return jsonify(vehicle.serialize(fields)), 200
 
 # -----------------------------------Add a Vehicle--------------------------------
 @app.route('/vehicles', methods=['POST'])
@@ -335,18 +490,57 @@ def update_vehicle(vehicle_id):
 
     return jsonify("Vehicle has been updated successfully", vehicle.serialize()), 200
 
+# -----------------------------------Bulk Add/Update Vehicles--------------------------------
+@app.route('/vehicles/bulk', methods=['POST'])
+def bulk_upsert_vehicles():
+    return jsonify(bulk_upsert(Vehicle)), 200
+
+# -----------------------------------Bulk Delete Vehicles--------------------------------
+@app.route('/vehicles/bulk', methods=['DELETE'])
+def bulk_delete_vehicles():
+    return jsonify(bulk_delete(Vehicle)), 200
+
 # -----------------------------------Delete a Vehicle--------------------------------
 @app.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
     vehicle = Vehicle.query.filter_by(id=vehicle_id).first()
     
     if vehicle:
+        remove_favorites_of(Vehicle, [vehicle_id])
         db.session.delete(vehicle)
         db.session.commit()
         return jsonify("Vehicle deleted successfully"), 200
     else:
         return jsonify("Vehicle not found"), 404
 
+
+# SEARCH ENDPOINTS
+# -----------------------------------Search Characters/Planets/Vehicles--------------------------------
+@app.route('/search', methods=['GET'])
+@query_budget(2)
+@conditional_get('character', 'planet', 'vehicle')
+@cached('character', 'planet', 'vehicle')
+def search_catalog():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error':'q is required'}), 400
+
+    kinds = request.args.get('type')
+    kinds = [kind.strip() for kind in kinds.split(',')] if kinds else list(SEARCHABLE)
+    unknown = [kind for kind in kinds if kind not in SEARCHABLE]
+    if unknown:
+        return jsonify({'error':f"Unknown type: {', '.join(unknown)}"}), 400
+
+    try:
+        limit = min(int(request.args.get('limit', 20)), app.config['SEARCH_MAX_RESULTS'])
+    except ValueError:
+        return jsonify({'error':'limit must be an integer'}), 400
+
+    return jsonify({'results': search(q, kinds, max(limit, 1))}), 200
+
+# every route is registered by now
+SITEMAP = Sitemap(app)
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
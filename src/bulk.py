@@ -0,0 +1,185 @@
+import json
+from itertools import islice
+from flask import current_app, request
+from sqlalchemy import Enum, Integer, String
+from sqlalchemy.exc import SQLAlchemyError
+from favorites import remove_favorites_of
+from models import db
+from utils import APIException
+
+def read_items():
+    """Items of a bulk request, from a JSON array or streamed line by line from NDJSON."""
+    if request.mimetype == 'application/x-ndjson':
+        return _read_ndjson(request.stream)
+    body = request.get_json(silent=True)
+    if not isinstance(body, list):
+        raise APIException('Body must be a JSON array or an application/x-ndjson stream', status_code=400)
+    return iter(body)
+
+def _read_ndjson(stream):
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield APIException(f'Invalid JSON on line {number}')
+
+def get_chunk_size():
+    chunk_size = request.args.get('chunk_size', current_app.config['BULK_CHUNK_SIZE'])
+    try:
+        chunk_size = int(chunk_size)
+    except (TypeError, ValueError):
+        raise APIException('chunk_size must be an integer', status_code=400)
+    if chunk_size < 1:
+        raise APIException('chunk_size must be greater than 0', status_code=400)
+    return min(chunk_size, current_app.config['BULK_MAX_CHUNK_SIZE'])
+
+def chunks(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+def writable_columns(model):
+    return [column for column in model.__table__.columns
+            if not column.primary_key and column.name not in model.READ_ONLY]
+
+def validate(model, item):
+    """Return the error for an item that can't be written to the model's table, or None."""
+    if isinstance(item, APIException):
+        return item.message
+    if not isinstance(item, dict):
+        return 'Item must be a JSON object'
+    for column in writable_columns(model):
+        value = item.get(column.name)
+        if value is None:
+            if not column.nullable and column.default is None:
+                return f'{column.name} is required'
+            continue
+        if isinstance(column.type, Enum):
+            if value not in column.type.enums:
+                return f"{column.name} must be one of {', '.join(column.type.enums)}"
+        elif isinstance(column.type, Integer):
+            if not isinstance(value, int) or isinstance(value, bool):
+                return f'{column.name} must be an integer'
+        elif isinstance(column.type, String):
+            if not isinstance(value, str):
+                return f'{column.name} must be a string'
+            if column.type.length is not None and len(value) > column.type.length:
+                return f'{column.name} must be at most {column.type.length} characters'
+    return None
+
+def _apply(model, obj, item):
+    for column in writable_columns(model):
+        if column.name in item or column.default is None:
+            setattr(obj, column.name, item.get(column.name))
+
+def _write_chunk(model, chunk, results):
+    """Upsert the valid items of a chunk by name in one transaction; returns False on failure."""
+    valid = [(index, item) for index, item, error in chunk if error is None]
+    names = {item['name'] for _, item in valid}
+    existing = {obj.name: obj for obj in model.query.filter(model.name.in_(names))} if names else {}
+    written = []
+    try:
+        for index, item in valid:
+            obj = existing.get(item['name'])
+            status = 'updated' if obj is not None else 'created'
+            if obj is None:
+                obj = model()
+                existing[item['name']] = obj
+                db.session.add(obj)
+            _apply(model, obj, item)
+            written.append((index, item['name'], status, obj))
+        db.session.flush()
+        ids = [obj.id for _, _, _, obj in written]
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return False
+
+    for (index, name, status, _), id in zip(written, ids):
+        results.append({'index': index, 'name': name, 'status': status, 'id': id})
+    for index, item, error in chunk:
+        if error is not None:
+            results.append({'index': index, 'name': item.get('name') if isinstance(item, dict) else None,
+                            'status': 'error', 'error': error})
+    return True
+
+def bulk_upsert(model):
+    """
+    Create or update (matched on the unique name) every item of the request, committing
+    once per chunk. A chunk that fails as a whole is retried item by item so the report
+    can point at the rows the database rejected.
+    """
+    chunk_size = get_chunk_size()
+    results = []
+    for chunk in chunks(enumerate(read_items()), chunk_size):
+        chunk = [(index, item, validate(model, item)) for index, item in chunk]
+        if _write_chunk(model, chunk, results):
+            continue
+        for index, item, error in chunk:
+            if error is not None or not _write_chunk(model, [(index, item, None)], results):
+                results.append({'index': index, 'name': item.get('name') if isinstance(item, dict) else None,
+                                'status': 'error', 'error': error or 'Rejected by the database'})
+
+    results.sort(key=lambda result: result['index'])
+    return _report(results)
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _delete_chunk(model, ids):
+    """Delete the rows with these ids in one transaction; returns the deleted ids or None on failure."""
+    found = model.query.filter(model.id.in_(ids)).all() if ids else []
+    deleted = {obj.id for obj in found}
+    try:
+        if deleted:
+            remove_favorites_of(model, deleted)
+        for obj in found:
+            db.session.delete(obj)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return None
+    return deleted
+
+def bulk_delete(model):
+    """
+    Delete every id of the request (a JSON array or NDJSON stream of ids), one commit per
+    chunk, falling back to one commit per id when the database rejects a chunk.
+    """
+    chunk_size = get_chunk_size()
+    results = []
+    for chunk in chunks(enumerate(read_items()), chunk_size):
+        ids = [id for _, id in chunk if _is_id(id)]
+        deleted = _delete_chunk(model, ids)
+        rejected = set()
+        if deleted is None:
+            deleted = set()
+            for id in ids:
+                outcome = _delete_chunk(model, [id])
+                if outcome is None:
+                    rejected.add(id)
+                else:
+                    deleted |= outcome
+
+        for index, id in chunk:
+            if not _is_id(id):
+                results.append({'index': index, 'id': None, 'status': 'error', 'error': 'Item must be an integer id'})
+            elif id in rejected:
+                results.append({'index': index, 'id': id, 'status': 'error', 'error': 'Rejected by the database'})
+            elif id in deleted:
+                results.append({'index': index, 'id': id, 'status': 'deleted'})
+            else:
+                results.append({'index': index, 'id': id, 'status': 'not_found'})
+    return _report(results)
+
+def _report(results):
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return {'counts': counts, 'results': results}
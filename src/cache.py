@@ -0,0 +1,352 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlparse
+from flask import current_app, g, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from compression import compress_response, negotiate_encoding
+from database import use_primary
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Backends store two kinds of data: entries, which expire and may be evicted, and
+# counters, which must never be evicted (a counter that resets could make an
+# invalidated entry look fresh again).
+
+class MemoryBackend:
+    """
+    Per-process LRU. Fine for a single worker; invalidations don't reach other workers,
+    which is why gunicorn.conf.py defaults CACHE_URL to a SQLite file.
+    """
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+    def counters(self, names):
+        with self._lock:
+            return [self._counters.get(name, 0) for name in names]
+
+    def size(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class SQLiteBackend:
+    """
+    Cache in a local SQLite file, shared by every gunicorn worker on the host. Entries
+    are evicted oldest-first once the table grows past max_entries.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries=2048):
+        self.path = path
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._local = threading.local()
+        self._sets = 0
+        conn = self._connection()
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_entry '
+                     '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, stored_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entry_stored_at ON cache_entry (stored_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_counter (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND expires >= ?', (key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires, stored_at) VALUES (?, ?, ?, ?)',
+                     (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl, now))
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            self._prune(conn, now)
+
+    def _prune(self, conn, now):
+        conn.execute('DELETE FROM cache_entry WHERE expires < ?', (now,))
+        overflow = self.size() - self.max_entries
+        if overflow > 0:
+            conn.execute('DELETE FROM cache_entry WHERE key IN '
+                         '(SELECT key FROM cache_entry ORDER BY stored_at LIMIT ?)', (overflow,))
+            self.evictions += overflow
+
+    def incr(self, name):
+        conn = self._connection()
+        conn.execute('INSERT INTO cache_counter (name, value) VALUES (?, 1) '
+                     'ON CONFLICT(name) DO UPDATE SET value = value + 1', (name,))
+        return conn.execute('SELECT value FROM cache_counter WHERE name = ?', (name,)).fetchone()[0]
+
+    def counters(self, names):
+        names = list(names)
+        placeholders = ','.join('?' * len(names))
+        rows = dict(self._connection().execute(
+            f'SELECT name, value FROM cache_counter WHERE name IN ({placeholders})', names).fetchall())
+        return [rows.get(name, 0) for name in names]
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entry')
+
+class RedisBackend:
+    """
+    Cache in Redis (or anything speaking its protocol). Entries get a TTL and counters
+    don't, so a volatile-* maxmemory policy only ever evicts entries.
+    """
+
+    evictions = None
+
+    def __init__(self, client, prefix='api-cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + 'entry:' + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + 'entry:' + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def incr(self, name):
+        return self.client.incr(self.prefix + 'counter:' + name)
+
+    def counters(self, names):
+        keys = [self.prefix + 'counter:' + name for name in names]
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+    def size(self):
+        return None
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + 'entry:*'):
+            self.client.delete(key)
+
+def backend_from_url(url, max_entries=2048):
+    """memory://, sqlite:////path/to/cache.db or redis://host:port/db"""
+    scheme = urlparse(url).scheme
+    if scheme == 'memory':
+        return MemoryBackend(max_entries)
+    if scheme == 'sqlite':
+        return SQLiteBackend(url[len('sqlite:///'):], max_entries)
+    if scheme in ('redis', 'rediss', 'unix'):
+        if redis is None:
+            raise RuntimeError('CACHE_URL points to redis but the redis package is not installed')
+        return RedisBackend(redis.Redis.from_url(url))
+    raise ValueError(f'Unsupported CACHE_URL: {url}')
+
+class ResponseCache:
+    """
+    Read-through cache of encoded response bodies. Every entry carries tags (a table name
+    like 'planet' or a row like 'planet:3') and the version each tag had when the entry
+    was built; a committed write bumps the versions of the tags it touches, which makes
+    the entries depending on them stale in every worker sharing the backend.
+    """
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CACHE_TTL', self.ttl)
+        self.backend = backend_from_url(app.config.get('CACHE_URL', 'memory://'),
+                                        app.config.get('CACHE_MAX_ENTRIES', 2048))
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is not None:
+            versions, value = entry
+            if self.backend.counters(['tag:' + tag for tag in versions]) == list(versions.values()):
+                self._count(True)
+                return value
+        self._count(False)
+        return None
+
+    def begin(self, tags):
+        """Snapshot the generation and tag versions before a value is built."""
+        generation, *versions = self.backend.counters(['generation'] + ['tag:' + tag for tag in tags])
+        return generation, dict(zip(tags, versions))
+
+    def set(self, key, value, token, extra_tags=()):
+        # CACHE_TTL=0 turns the cache off
+        if self.ttl <= 0:
+            return
+        generation, versions = token
+        extra_tags = [tag for tag in extra_tags if tag not in versions]
+        current, *extra_versions = self.backend.counters(['generation'] + ['tag:' + tag for tag in extra_tags])
+        # a write committed while this value was being built, so it may already be stale
+        if current != generation:
+            return
+        versions = {**versions, **dict(zip(extra_tags, extra_versions))}
+        self.backend.set(key, (versions, value), self.ttl)
+
+    def invalidate(self, tags):
+        self.backend.incr('generation')
+        for tag in tags:
+            self.backend.incr('tag:' + tag)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': self.backend.size(),
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'evictions': self.backend.evictions,
+        }
+
+response_cache = ResponseCache()
+
+def configure_cache(app):
+    app.config['CACHE_URL'] = os.getenv("CACHE_URL", "memory://")
+    app.config['CACHE_MAX_ENTRIES'] = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+    app.config['CACHE_TTL'] = int(os.getenv("CACHE_TTL", 300))
+
+def add_cache_tags(*tags):
+    """Let a view declare extra rows its response depends on, e.g. a character's homeworld."""
+    g.setdefault('cache_tags', set()).update(tags)
+
+def cached(*table_names):
+    """
+    Cache successful GET responses per URL and Accept header, building misses on the
+    primary rather than a read replica. List responses are tagged with every table they
+    read; detail responses with their own row plus whatever the view adds through
+    add_cache_tags(), and with '<table>:*' for each of those tables so a large write can
+    invalidate all rows of a table at once.
+    With COMPRESS_CACHED, entries are kept per negotiated encoding, compressed once.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            encoding = negotiate_encoding() if current_app.config.get('COMPRESS_CACHED') else None
+            key = f"{request.full_path}|{request.headers.get('Accept', '')}|{encoding or ''}"
+            hit = response_cache.get(key)
+            if hit is not None:
+                body, mimetype, content_encoding = hit
+                response = make_response(body, 200, {'Content-Type': mimetype})
+                if content_encoding:
+                    response.headers['Content-Encoding'] = content_encoding
+                response.vary.add('Accept-Encoding')
+                return response
+
+            if kwargs:
+                tags = [f'{table_names[0]}:{value}' for value in kwargs.values()] + [f'{table_names[0]}:*']
+            else:
+                tags = list(table_names)
+            token = response_cache.begin(tags)
+            g.pop('cache_tags', None)
+            if response_cache.ttl > 0:
+                # a replica may still lag the write that invalidated this entry, and what is
+                # stored now is served for CACHE_TTL: build it from the primary
+                use_primary()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                extra_tags = set(g.get('cache_tags', ()))
+                extra_tags.update(f"{tag.split(':')[0]}:*" for tag in list(extra_tags))
+                compress_response(response, encoding)
+                response_cache.set(key, (response.get_data(), response.content_type,
+                                         response.headers.get('Content-Encoding')), token, extra_tags)
+            return response
+        return wrapper
+    return decorator
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_tags(session, flush_context):
+    tags = session.info.setdefault('changed_cache_tags', set())
+    for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+        table_name = obj.__table__.name
+        tags.add(table_name)
+        if getattr(obj, 'id', None) is not None:
+            tags.add(f'{table_name}:{obj.id}')
+
+def mark_changed(session, tags):
+    """Tag rows written outside the ORM flush (Core UPDATEs) so the commit invalidates them too."""
+    session.info.setdefault('changed_cache_tags', set()).update(tags)
+
+# past this many rows of one table in a commit, bump '<table>:*' instead of every row
+ROW_TAG_LIMIT = 100
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_tags(session):
+    tags = session.info.pop('changed_cache_tags', None)
+    if not tags:
+        return
+    rows_by_table = {}
+    for tag in tags:
+        if ':' in tag:
+            rows_by_table.setdefault(tag.split(':')[0], []).append(tag)
+    for table_name, row_tags in rows_by_table.items():
+        if len(row_tags) > ROW_TAG_LIMIT:
+            tags.difference_update(row_tags)
+            tags.add(f'{table_name}:*')
+    response_cache.invalidate(tags)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_tags(session):
+    session.info.pop('changed_cache_tags', None)
@@ -0,0 +1,89 @@
+import gzip
+import os
+import zlib
+from flask import current_app, has_request_context, request
+from database import env_flag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('application/json', 'application/x-ndjson')
+
+def encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate_encoding():
+    """The Content-Encoding this request accepts and the server would use, or None."""
+    if not has_request_context() or not current_app.config.get('COMPRESS_ENABLED'):
+        return None
+    return request.accept_encodings.best_match(encodings())
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    # mtime=0 keeps the output (and so cached bodies) byte for byte reproducible
+    return gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL'], mtime=0)
+
+def compress_stream(chunks, encoding, brotli_quality, level):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=brotli_quality)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            output = process(chunk.encode() if isinstance(chunk, str) else chunk)
+            if output:
+                yield output
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+def compressible(response):
+    return (response.mimetype in COMPRESSIBLE or response.mimetype.startswith('text/')) \
+        and 200 <= response.status_code < 300 and response.status_code != 204 \
+        and 'Content-Encoding' not in response.headers
+
+def compress_response(response, encoding):
+    """
+    Compress a response in place with the negotiated encoding: whole bodies past
+    COMPRESS_MIN_SIZE, streamed bodies (NDJSON exports) chunk by chunk.
+    """
+    if not compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        config = current_app.config
+        response.response = compress_stream(response.response, encoding,
+                                            config['COMPRESS_BROTLI_QUALITY'], config['COMPRESS_LEVEL'])
+        response.headers.pop('Content-Length', None)
+    else:
+        if response.calculate_content_length() < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def _compress_after_request(response):
+    return compress_response(response, negotiate_encoding())
+
+def init_compression(app):
+    """
+    gzip (and brotli when the package is installed) negotiated from Accept-Encoding for
+    JSON, NDJSON and text responses.
+    """
+    app.config['COMPRESS_ENABLED'] = env_flag('COMPRESS_ENABLED', True)
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.getenv("COMPRESS_LEVEL", 6))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+    # keep cached responses compressed (one entry per encoding) instead of compressing every hit
+    app.config['COMPRESS_CACHED'] = env_flag('COMPRESS_CACHED', True)
+    if app.config['COMPRESS_ENABLED']:
+        app.after_request(_compress_after_request)
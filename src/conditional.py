@@ -0,0 +1,52 @@
+import hashlib
+from functools import wraps
+from flask import make_response, request
+from compression import negotiate_encoding
+from models import TableVersion
+
+def conditional_get(*table_names, depends=None):
+    """
+    Answer conditional GETs from the version rows of the tables a response is built from,
+    so a client that already has the current payload gets a 304 without the view running.
+    depends, when given, returns the tables this particular request reads on top of those
+    (e.g. the relations of ?expand=).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            tables = set(table_names)
+            if depends is not None:
+                tables.update(depends())
+            versions = TableVersion.snapshot(tables)
+            fingerprint = '|'.join(
+                [request.full_path, request.headers.get('Accept', '')] +
+                [f'{name}:{version}:{updated_at.isoformat()}' for name, version, updated_at in versions]
+            )
+            etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+            # every encoding of the payload is a different representation
+            encoding = negotiate_encoding()
+            if encoding:
+                etag = f'{etag}-{encoding}'
+            last_modified = max((updated_at for _, _, updated_at in versions), default=None)
+
+            if request.if_none_match:
+                not_modified = etag in request.if_none_match
+            else:
+                not_modified = (last_modified is not None and request.if_modified_since is not None
+                                and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None))
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            response.vary.add('Accept')
+            response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,127 @@
+import os
+import random
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+def env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+def database_uri():
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        return db_url.replace("postgres://", "postgresql://")
+    return "sqlite:////tmp/test.db"
+
+def engine_options(uri):
+    """
+    Engine options from the environment. Size DB_POOL_SIZE + DB_MAX_OVERFLOW to cover the
+    threads of one worker; every gunicorn worker gets its own pool.
+    """
+    options = {'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True)}
+    if make_url(uri).get_backend_name() != 'sqlite':
+        options.update({
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+            # recycle before the server (or a proxy in between) drops idle connections
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        })
+    return options
+
+def replica_uris():
+    """DATABASE_READ_URL, a comma separated list of read replicas."""
+    urls = os.getenv("DATABASE_READ_URL", "")
+    return [url.strip().replace("postgres://", "postgresql://") for url in urls.split(',') if url.strip()]
+
+def configure_database(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = {
+        f'{REPLICA_PREFIX}{number}': {'url': uri, **engine_options(uri)}
+        for number, uri in enumerate(replica_uris())
+    }
+    app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+
+REPLICA_PREFIX = 'replica_'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+class RoutingSession(FlaskSession):
+    """
+    Sends the reads of GET requests to a read replica, when DATABASE_READ_URL configures
+    any. Writes, non-GET requests and everything a request runs after it has flushed a
+    write (read-after-write) stay on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica():
+            replica = self._replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self):
+        return (has_request_context()
+                and request.method in READ_METHODS
+                and not self._flushing
+                and not self.info.get('wrote')
+                and not g.get('use_primary'))
+
+    def _replica(self):
+        # pick one replica per session so a request sees a single, consistent snapshot
+        if 'replica' not in self.info:
+            keys = [key for key in self._db.engines if isinstance(key, str) and key.startswith(REPLICA_PREFIX)]
+            self.info['replica'] = random.choice(keys) if keys else None
+        key = self.info['replica']
+        return self._db.engines[key] if key is not None else None
+
+@event.listens_for(Session, 'after_flush')
+def mark_session_wrote(session, flush_context):
+    session.info['wrote'] = True
+
+def use_primary():
+    """Read from the primary for the rest of this request, e.g. right after the client wrote."""
+    g.use_primary = True
+
+def statement_timeout(milliseconds):
+    """Override DB_STATEMENT_TIMEOUT_MS for the transactions of one view."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.statement_timeout_ms = milliseconds
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@event.listens_for(Session, 'after_begin')
+def set_statement_timeout(session, transaction, connection):
+    if not has_app_context() or connection.dialect.name != 'postgresql':
+        return
+    timeout = g.get('statement_timeout_ms', current_app.config.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if timeout:
+        # SET LOCAL only lasts until the end of this transaction, so it never leaks to the pool
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout)}')
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'class': type(pool).__name__}
+    for key, name in (('size', 'size'), ('checked_in', 'checkedin'),
+                      ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[key] = method()
+    return stats
+
+def check_database(engine):
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+    return round((time.perf_counter() - start) * 1000, 3)
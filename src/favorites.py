@@ -0,0 +1,116 @@
+"""
+favorite_count on planets, characters and vehicles: counters updated in the same
+transaction as the favorites rows they count, so neither the field nor the
+/favorites/top leaderboard has to GROUP BY over favorites. `flask reconcile-favorites`
+recounts them from scratch should they ever drift.
+"""
+from collections import Counter
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, update
+from cache import mark_changed
+from models import db, Character, Favorites, Planet, Vehicle, bump_table_versions, counts_tag
+
+# favorite type, as in the routes and table names -> (model, column of favorites pointing at it)
+KINDS = {
+    'planet': (Planet, 'planet_id'),
+    'character': (Character, 'character_id'),
+    'vehicle': (Vehicle, 'vehicle_id'),
+}
+# what the leaderboard depends on besides the three tables
+COUNT_TAGS = tuple(counts_tag(model) for model, _ in KINDS.values())
+
+def count_changes(favorites, delta):
+    """{kind: Counter(id -> delta)} for every entity the favorites point at."""
+    changes = {kind: Counter() for kind in KINDS}
+    for favorite in favorites:
+        for kind, (_, column) in KINDS.items():
+            id = getattr(favorite, column)
+            if id is not None:
+                changes[kind][id] += delta
+    return changes
+
+def adjust_counts(changes):
+    """
+    Apply count_changes() with one UPDATE per kind and delta, in the session's transaction.
+    The UPDATEs bypass the ORM flush, so versions and cache tags are bumped here: the
+    counted rows' own tags, for detail routes, and counts_tag() rather than the table's,
+    which only the responses showing favorite_count depend on.
+    """
+    tags = set()
+    for kind, counts in changes.items():
+        model = KINDS[kind][0]
+        ids_by_delta = {}
+        for id, delta in counts.items():
+            if delta:
+                ids_by_delta.setdefault(delta, []).append(id)
+        for delta, ids in ids_by_delta.items():
+            db.session.execute(
+                update(model).where(model.id.in_(sorted(ids))).values(favorite_count=model.favorite_count + delta)
+            )
+            tags.add(counts_tag(model))
+            tags.update(f'{kind}:{id}' for id in ids)
+    if tags:
+        bump_table_versions(db.session.connection(), {tag for tag in tags if ':' not in tag})
+        mark_changed(db.session, tags)
+
+def insert_favorite(favorite):
+    """Insert a favorite and count it; flushing first so a duplicate fails before any counter moves."""
+    db.session.add(favorite)
+    db.session.flush()
+    adjust_counts(count_changes([favorite], 1))
+
+def remove_favorites(favorites, skip_kind=None):
+    """
+    Delete favorites and uncount them. The delete is flushed before the counters move so
+    rows get locked in the same order as insert_favorite() takes them (the favorites
+    version, then the counters); the opposite order deadlocks against a concurrent add.
+    """
+    changes = count_changes(favorites, -1)
+    if skip_kind is not None:
+        del changes[skip_kind]
+    for favorite in favorites:
+        db.session.delete(favorite)
+    db.session.flush()
+    adjust_counts(changes)
+
+def remove_favorites_of(model, ids):
+    """
+    Call before deleting these planets, characters or vehicles: removes the favorites
+    pointing at them and uncounts whatever else those rows point at.
+    """
+    kind = model.__tablename__
+    column = getattr(Favorites, KINDS[kind][1])
+    # the deleted rows' own counters go away with them
+    remove_favorites(Favorites.query.filter(column.in_(ids)).all(), skip_kind=kind)
+
+def most_favorited(kind, fields=None):
+    """The most favorited entities of a kind first, read off the (favorite_count, id) index."""
+    model = KINDS[kind][0]
+    return model.row_query(model.query.filter(model.favorite_count > 0), fields) \
+        .order_by(model.favorite_count.desc(), model.id.desc())
+
+def reconcile():
+    """Recount every favorite_count from the favorites table; returns the rows fixed per kind."""
+    fixed = {}
+    for kind, (model, column) in KINDS.items():
+        actual = select(func.count(Favorites.id)).where(getattr(Favorites, column) == model.id).scalar_subquery()
+        result = db.session.execute(
+            update(model).where(model.favorite_count != actual).values(favorite_count=actual)
+            .execution_options(synchronize_session=False)
+        )
+        fixed[kind] = result.rowcount
+    changed = [kind for kind, count in fixed.items() if count]
+    if changed:
+        tags = {counts_tag(KINDS[kind][0]) for kind in changed}
+        bump_table_versions(db.session.connection(), tags)
+        mark_changed(db.session, tags | {f'{kind}:*' for kind in changed})
+    db.session.commit()
+    return fixed
+
+@click.command('reconcile-favorites')
+@with_appcontext
+def reconcile_command():
+    """Recount favorite_count on planets, characters and vehicles."""
+    for kind, count in reconcile().items():
+        click.echo(f'{kind}: {count} fixed')
@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from flask.json.provider import JSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import env_flag
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+class Histogram:
+    """Cumulative Prometheus histogram with an `endpoint` label."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for endpoint, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ['+Inf'], series['counts']):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{endpoint="{endpoint}"}} {series["sum"]}')
+                lines.append(f'{self.name}_count{{endpoint="{endpoint}"}} {cumulative}')
+        return lines
+
+HISTOGRAMS = {
+    'duration': Histogram('api_request_duration_seconds', 'Time spent handling the request.', TIME_BUCKETS),
+    'db_time': Histogram('api_db_duration_seconds', 'Time spent in SQL statements per request.', TIME_BUCKETS),
+    'queries': Histogram('api_db_queries', 'SQL statements executed per request.', COUNT_BUCKETS),
+    'serialize_time': Histogram('api_serialize_duration_seconds', 'Time spent encoding JSON per request.', TIME_BUCKETS),
+    'size': Histogram('api_response_size_bytes', 'Response body size.', SIZE_BUCKETS),
+}
+
+class RequestStats:
+    __slots__ = ('start', 'queries', 'db_time', 'serialize_time')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+def current_stats():
+    return g.get('request_stats') if has_request_context() else None
+
+class TimedJSONProvider(JSONProvider):
+    """Delegates to the app's JSON provider and adds the time spent encoding to the request."""
+
+    def __init__(self, app, provider):
+        super().__init__(app)
+        self.provider = provider
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats = current_stats()
+            if stats is not None:
+                stats.serialize_time += time.perf_counter() - start
+
+    def dumps(self, obj, **kwargs):
+        return self._timed(self.provider.dumps, obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return self.provider.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        return self._timed(self.provider.response, *args, **kwargs)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    if stats is not None and conn.info.get('query_start'):
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - conn.info['query_start'].pop()
+
+def _start_request():
+    g.request_stats = RequestStats()
+
+def _finish_request(response):
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    elapsed = time.perf_counter() - stats.start
+    app_time = max(elapsed - stats.db_time - stats.serialize_time, 0)
+    response.headers['Server-Timing'] = ', '.join([
+        f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+        f'serialize;dur={stats.serialize_time * 1000:.2f}',
+        f'app;dur={app_time * 1000:.2f}',
+        f'total;dur={elapsed * 1000:.2f}',
+    ])
+
+    if response.is_streamed:
+        # a streamed export is recorded once the client consumed it, including the
+        # statements and encoding done meanwhile
+        response.call_on_close(lambda: _record(endpoint, stats, None))
+    else:
+        _record(endpoint, stats, response.calculate_content_length() or 0)
+    return response
+
+def _record(endpoint, stats, size):
+    HISTOGRAMS['duration'].observe(endpoint, time.perf_counter() - stats.start)
+    HISTOGRAMS['db_time'].observe(endpoint, stats.db_time)
+    HISTOGRAMS['queries'].observe(endpoint, stats.queries)
+    HISTOGRAMS['serialize_time'].observe(endpoint, stats.serialize_time)
+    if size is not None:
+        HISTOGRAMS['size'].observe(endpoint, size)
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.render())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app):
+    """
+    Per-request SQL count, DB time, JSON encoding time and response size, reported in a
+    Server-Timing header and aggregated per endpoint at /metrics (Prometheus text format).
+    Nothing is hooked in unless METRICS_ENABLED is set. Histograms are per process.
+    """
+    app.config['METRICS_ENABLED'] = env_flag('METRICS_ENABLED', False)
+    if not app.config['METRICS_ENABLED']:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.json = TimedJSONProvider(app, app.json)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', render_metrics, methods=['GET'])
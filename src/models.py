@@ -1,22 +1,123 @@
+from dataclasses import make_dataclass
+from datetime import datetime
+from functools import lru_cache
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, load_only
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+@lru_cache(maxsize=256)
+def row_type(model, fields):
+    # slots keep rows small; orjson encodes dataclasses without building a dict per row
+    return make_dataclass(f'{model.__name__}Row', fields, slots=True)
+
+class SerializerMixin:
+    # fields serialize() emits by default, in order
+    FIELDS = ()
+    # fields read from a related row: field -> (relationship, attribute of the related model)
+    RELATED_FIELDS = {}
+    # columns clients may filter on with ?<field>= and ?<field>_min=/?<field>_max=
+    FILTERS = ()
+    RANGE_FILTERS = ()
+    # columns clients may sort on, each backed by an index ending in id
+    SORTS = ('id',)
+    # columns the API maintains itself, which clients can't write
+    READ_ONLY = ()
+    # relations clients may nest with ?expand=<name>:
+    # name -> (related model, local key, key on the related model, to-many)
+    EXPANSIONS = {}
+
+    def serialize(self, fields=None):
+        data = {}
+        for field in fields or self.FIELDS:
+            if field in self.RELATED_FIELDS:
+                relationship, attribute = self.RELATED_FIELDS[field]
+                related = getattr(self, relationship)
+                data[field] = getattr(related, attribute) if related else None
+            else:
+                data[field] = getattr(self, field)
+        return data
+
+    @classmethod
+    def load_options(cls, fields=None):
+        """Query options so only the columns (and joins) serialize(fields) reads get selected."""
+        fields = fields or cls.FIELDS
+        columns = [getattr(cls, field) for field in fields if field not in cls.RELATED_FIELDS]
+        options = []
+        for field in fields:
+            if field in cls.RELATED_FIELDS:
+                relationship, attribute = cls.RELATED_FIELDS[field]
+                prop = getattr(cls, relationship).property
+                # keep the foreign key around too, views use it to tag cached responses
+                columns.extend(getattr(cls, column.key) for column in prop.local_columns)
+                options.append(joinedload(getattr(cls, relationship)).load_only(getattr(prop.mapper.class_, attribute)))
+        if columns:
+            options.insert(0, load_only(*columns))
+        return options
+
+    @classmethod
+    def row_query(cls, query, fields=None, extra=None):
+        """
+        The query selecting plain rows instead of model instances: the values serialize(fields)
+        would emit, then id and the SORTS columns paginate() builds its cursors from, then
+        the extra columns (label -> column) a view needs besides, such as expansion keys.
+        """
+        fields = fields or cls.FIELDS
+        columns = []
+        joins = []
+        for field in fields:
+            if field in cls.RELATED_FIELDS:
+                relationship, attribute = cls.RELATED_FIELDS[field]
+                relationship = getattr(cls, relationship)
+                columns.append(getattr(relationship.property.mapper.class_, attribute).label(field))
+                joins.append(relationship)
+            else:
+                columns.append(getattr(cls, field).label(field))
+        columns.extend(getattr(cls, field).label(field) for field in cls.SORTS if field not in fields)
+        columns.extend(column.label(label) for label, column in (extra or {}).items())
+        query = query.with_entities(*columns)
+        for relationship in joins:
+            query = query.outerjoin(relationship)
+        return query
+
+    @classmethod
+    def row_serializer(cls, fields=None):
+        """Turns a row of row_query(fields) into a dataclass instance encoded like serialize(fields)."""
+        fields = fields or cls.FIELDS
+        make_row = row_type(cls, fields)
+        count = len(fields)
+        return lambda row: make_row(*row[:count])
+
+    @classmethod
+    def serialize_rows(cls, rows, fields=None):
+        return list(map(cls.row_serializer(fields), rows))
+
+class User(SerializerMixin, db.Model):
+    FIELDS = ('id', 'email')
 
-class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(80), unique=False, nullable=False)
 
     def __repr__(self):
         return '<User %r>' % self.id
-
-    def serialize(self):
-        return {
-            "id": self.id,
-            "email": self.email,
-        }
     
-class Planet(db.Model):
+class Planet(SerializerMixin, db.Model):
+    FIELDS = ('id', 'name', 'terrain', 'climate', 'population', 'orbital_period',
+              'rotation_period', 'diameter', 'description', 'image_url', 'favorite_count')
+    FILTERS = ('name', 'climate')
+    RANGE_FILTERS = ('diameter',)
+    SORTS = ('id', 'name', 'diameter', 'favorite_count')
+    READ_ONLY = ('favorite_count',)
+    __table_args__ = (
+        db.Index('ix_planet_climate_id', 'climate', 'id'),
+        db.Index('ix_planet_diameter_id', 'diameter', 'id'),
+        db.Index('ix_planet_favorite_count_id', 'favorite_count', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     terrain = db.Column(db.String(150), nullable=False)
@@ -27,25 +128,27 @@ class Planet(db.Model):
     diameter = db.Column(db.Integer, nullable=False)
     description = db.Column(db.String(1000), nullable=False)
     image_url = db.Column(db.String(500))
+    # favorites rows pointing here, kept up to date by favorites.py
+    favorite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return '<Planet %r>' % self.name
 
-    def serialize(self):
-        return {
-            "id": self.id,
-            "name": self.name,
-            "terrain": self.terrain,
-            "climate": self.climate,
-            "population": self.population,
-            "orbital_period": self.orbital_period,
-            "rotation_period": self.rotation_period,
-            "diameter": self.diameter,
-            "description": self.description,
-            "image_url": self.image_url
-        }
+class Character(SerializerMixin, db.Model):
+    FIELDS = ('id', 'name', 'gender', 'birth_year', 'height', 'hair_color', 'eye_color',
+              'homeworld', 'description', 'image_url', 'favorite_count')
+    RELATED_FIELDS = {'homeworld': ('planet', 'name')}
+    FILTERS = ('name', 'gender', 'planet_id')
+    RANGE_FILTERS = ('height',)
+    SORTS = ('id', 'name', 'height', 'favorite_count')
+    READ_ONLY = ('favorite_count',)
+    __table_args__ = (
+        db.Index('ix_character_gender_id', 'gender', 'id'),
+        db.Index('ix_character_planet_id_id', 'planet_id', 'id'),
+        db.Index('ix_character_height_id', 'height', 'id'),
+        db.Index('ix_character_favorite_count_id', 'favorite_count', 'id'),
+    )
 
-class Character(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     gender = db.Column(db.Enum('female', 'male', 'other', 'n/a', name="gender_types"), nullable=False)
@@ -57,26 +160,27 @@ class Character(db.Model):
     image_url = db.Column(db.String(500))
     planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
     planet = db.relationship(Planet)
+    favorite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return '<Character %r>' % self.name
 
-    def serialize(self):
-        planet_name = self.planet.name if self.planet else None
-        return {
-            "id": self.id,
-            "name": self.name,
-            "gender": self.gender,
-            "birth_year": self.birth_year,
-            "height": self.height,
-            "hair_color": self.hair_color,
-            "eye_color": self.eye_color,
-            "homeworld": planet_name,
-            "description": self.description,
-            "image_url": self.image_url
-        }
+class Vehicle(SerializerMixin, db.Model):
+    # pilot_id carries the pilot's name, as it always has
+    FIELDS = ('id', 'name', 'model', 'vehicle_class', 'manufacturer', 'length', 'passengers',
+              'pilot_id', 'description', 'image_url', 'favorite_count')
+    RELATED_FIELDS = {'pilot_id': ('character', 'name')}
+    # the pilot_id filter takes the pilot's id
+    FILTERS = ('name', 'pilot_id')
+    RANGE_FILTERS = ('passengers',)
+    SORTS = ('id', 'name', 'passengers', 'favorite_count')
+    READ_ONLY = ('favorite_count',)
+    __table_args__ = (
+        db.Index('ix_vehicle_pilot_id_id', 'pilot_id', 'id'),
+        db.Index('ix_vehicle_passengers_id', 'passengers', 'id'),
+        db.Index('ix_vehicle_favorite_count_id', 'favorite_count', 'id'),
+    )
 
-class Vehicle(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     model = db.Column(db.String(100), nullable=False)
@@ -88,28 +192,46 @@ class Vehicle(db.Model):
     image_url = db.Column(db.String(500))
     pilot_id = db.Column(db.Integer, db.ForeignKey('character.id'))
     character = db.relationship(Character)
+    favorite_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return '<Vehicle %r>' % self.name
 
-    def serialize(self):
-        pilot_name = self.character.name if self.character else None
-        return {
-            "id": self.id,
-            "name": self.name,
-            "model": self.model,
-            "vehicle_class": self.vehicle_class,
-            "manufacturer": self.manufacturer,
-            "length": self.length,
-            "passengers": self.passengers,
-            "pilot_id": pilot_name,
-            "description": self.description,
-            "image_url": self.image_url
-        }
+# set once every model exists, since characters and vehicles point at each other
+Character.EXPANSIONS = {
+    'homeworld': (Planet, 'planet_id', 'id', False),
+    'vehicles': (Vehicle, 'id', 'pilot_id', True),
+}
+Planet.EXPANSIONS = {
+    'residents': (Character, 'id', 'planet_id', True),
+}
     
 class Favorites(db.Model):
+    # one favorite per (user, entity); partial so each index only holds rows of its own kind
+    __table_args__ = (
+        db.Index('ix_favorites_user_character', 'user_id', 'character_id', unique=True,
+                 postgresql_where=db.text('character_id IS NOT NULL'),
+                 sqlite_where=db.text('character_id IS NOT NULL')),
+        db.Index('ix_favorites_user_planet', 'user_id', 'planet_id', unique=True,
+                 postgresql_where=db.text('planet_id IS NOT NULL'),
+                 sqlite_where=db.text('planet_id IS NOT NULL')),
+        db.Index('ix_favorites_user_vehicle', 'user_id', 'vehicle_id', unique=True,
+                 postgresql_where=db.text('vehicle_id IS NOT NULL'),
+                 sqlite_where=db.text('vehicle_id IS NOT NULL')),
+        # favorites of an entity, for counting them and deleting them with it
+        db.Index('ix_favorites_character_id', 'character_id',
+                 postgresql_where=db.text('character_id IS NOT NULL'),
+                 sqlite_where=db.text('character_id IS NOT NULL')),
+        db.Index('ix_favorites_planet_id', 'planet_id',
+                 postgresql_where=db.text('planet_id IS NOT NULL'),
+                 sqlite_where=db.text('planet_id IS NOT NULL')),
+        db.Index('ix_favorites_vehicle_id', 'vehicle_id',
+                 postgresql_where=db.text('vehicle_id IS NOT NULL'),
+                 sqlite_where=db.text('vehicle_id IS NOT NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     character_id = db.Column(db.Integer, db.ForeignKey('character.id'))
     planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'))
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'))
@@ -122,11 +244,78 @@ class Favorites(db.Model):
         return '<Favorites %r>' % self.user_id
 
     def serialize(self):
-        characters = [favorite.character.name for favorite in Favorites.query.filter(Favorites.character_id.isnot(None)).all()]
-        planets = [favorite.planet.name for favorite in Favorites.query.filter(Favorites.planet_id.isnot(None)).all()]
-        vehicles = [favorite.vehicle.name for favorite in Favorites.query.filter(Favorites.vehicle_id.isnot(None)).all()]
-        return {
-            "character_id": characters,
-            "planets": planets,
-            "vehicle_id": vehicles
+        return Favorites.serialize_for_user(self.user_id)
+
+    @classmethod
+    def serialize_for_user(cls, user_id):
+        # one query filtered by user_id, names pulled in through outer joins
+        rows = db.session.query(
+            cls.character_id, Character.name.label('character_name'),
+            cls.planet_id, Planet.name.label('planet_name'),
+            cls.vehicle_id, Vehicle.name.label('vehicle_name')
+        ).outerjoin(Character, cls.character_id == Character.id) \
+         .outerjoin(Planet, cls.planet_id == Planet.id) \
+         .outerjoin(Vehicle, cls.vehicle_id == Vehicle.id) \
+         .filter(cls.user_id == user_id) \
+         .order_by(cls.id) \
+         .all()
+
+        favorites = {
+            "favorite_characters": [],
+            "favorite_planets": [],
+            "favorite_vehicles": []
         }
+        for row in rows:
+            if row.character_id is not None:
+                favorites["favorite_characters"].append({"id": row.character_id, "name": row.character_name})
+            if row.planet_id is not None:
+                favorites["favorite_planets"].append({"id": row.planet_id, "name": row.planet_name})
+            if row.vehicle_id is not None:
+                favorites["favorite_vehicles"].append({"id": row.vehicle_id, "name": row.vehicle_name})
+        return favorites
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_version'
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return '<TableVersion %r %r>' % (self.table_name, self.version)
+
+    @classmethod
+    def snapshot(cls, table_names):
+        rows = cls.query.filter(cls.table_name.in_(table_names)).all()
+        return sorted((row.table_name, row.version, row.updated_at) for row in rows)
+
+def counts_tag(model):
+    # the version row and cache tag favorite_count changes bump instead of the table's own,
+    # so a favorite only touches the responses that show counts
+    return f'{model.__tablename__}_favorites'
+
+# INSERT ... ON CONFLICT DO NOTHING, per dialect
+INSERT_IGNORING_CONFLICTS = {
+    'postgresql': lambda table: postgresql.insert(table).on_conflict_do_nothing(),
+    'sqlite': lambda table: sqlite.insert(table).on_conflict_do_nothing(),
+}
+
+def bump_table_versions(connection, table_names):
+    """Mark tables as changed; call it for writes that bypass the ORM flush."""
+    table = TableVersion.__table__
+    now = datetime.utcnow()
+    for name in sorted(table_names):
+        bump = table.update().where(table.c.table_name == name).values(version=table.c.version + 1, updated_at=now)
+        if connection.execute(bump).rowcount == 0:
+            # a row nothing seeded: a concurrent first bump may insert it too, so create it
+            # at 0 without failing on that conflict and bump whichever row won
+            insert = INSERT_IGNORING_CONFLICTS[connection.dialect.name](table)
+            connection.execute(insert.values(table_name=name, version=0, updated_at=now))
+            connection.execute(bump)
+
+@event.listens_for(Session, 'before_flush')
+def bump_flushed_table_versions(session, flush_context, instances):
+    changed = set(session.new) | set(session.deleted)
+    changed.update(obj for obj in session.dirty if session.is_modified(obj))
+    table_names = {obj.__table__.name for obj in changed if not isinstance(obj, TableVersion)}
+    if table_names:
+        bump_table_versions(session.connection(), table_names)
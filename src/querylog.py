@@ -0,0 +1,88 @@
+import os
+import re
+import time
+from collections import Counter
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from database import env_flag
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised instead of logged in testing or with QUERY_BUDGET_RAISE, so a test fails on the regression."""
+
+def query_budget(max_queries):
+    """Override QUERY_BUDGET for one view: the most SQL statements it may run per request."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.query_budget = max_queries
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _shape(statement):
+    # expanding IN parameters render one placeholder per value; fold them so those match too
+    return re.sub(r'\((?:\?|%\(\w+\)s|:\w+)(?:,\s*(?:\?|%\(\w+\)s|:\w+))*\)', '(...)', ' '.join(statement.split()))
+
+def _endpoint():
+    return request.endpoint if has_request_context() else None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_log_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_log_start')
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    # the listeners are process-wide: skip apps that didn't enable the log, like the lazy admin app
+    if not has_app_context() or not current_app.config.get('QUERY_LOG_ENABLED'):
+        return
+    config = current_app.config
+    if config['SLOW_QUERY_MS'] and elapsed_ms >= config['SLOW_QUERY_MS']:
+        current_app.logger.warning('Slow query (%.1f ms) in %s: %s; parameters: %r',
+                                   elapsed_ms, _endpoint(), statement, parameters)
+    # SET LOCAL statement_timeout and the like are connection setup, not queries of the view
+    if has_request_context() and not executemany and not statement.startswith('SET '):
+        g.setdefault('query_shapes', Counter())[_shape(statement)] += 1
+
+def _check_request(response):
+    shapes = g.pop('query_shapes', None)
+    if not shapes:
+        return response
+    config = current_app.config
+    endpoint = _endpoint()
+    threshold = config['NPLUSONE_THRESHOLD']
+    if threshold:
+        for shape, count in shapes.items():
+            if count >= threshold:
+                current_app.logger.warning('Possible N+1 in %s: the same query ran %d times: %s',
+                                           endpoint, count, shape)
+
+    budget = g.get('query_budget', config['QUERY_BUDGET'])
+    total = sum(shapes.values())
+    if budget and total > budget:
+        message = f'{endpoint} ran {total} queries, over its budget of {budget}'
+        if config['QUERY_BUDGET_RAISE'] or current_app.testing:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+def init_query_log(app):
+    """
+    Opt-in (QUERY_LOG_ENABLED) diagnostics on top of the engine events: statements slower
+    than SLOW_QUERY_MS are logged with their endpoint and parameters, requests repeating
+    one statement NPLUSONE_THRESHOLD times or more are flagged as a likely N+1, and
+    requests over their query budget are logged, or raise in testing or with QUERY_BUDGET_RAISE.
+    """
+    app.config['QUERY_LOG_ENABLED'] = env_flag('QUERY_LOG_ENABLED', False)
+    app.config['SLOW_QUERY_MS'] = int(os.getenv("SLOW_QUERY_MS", 100))
+    app.config['NPLUSONE_THRESHOLD'] = int(os.getenv("NPLUSONE_THRESHOLD", 5))
+    app.config['QUERY_BUDGET'] = int(os.getenv("QUERY_BUDGET", 0))
+    app.config['QUERY_BUDGET_RAISE'] = env_flag('QUERY_BUDGET_RAISE', False)
+    if not app.config['QUERY_LOG_ENABLED']:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.after_request(_check_request)
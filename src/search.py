@@ -0,0 +1,97 @@
+from sqlalchemy import DDL, event, or_, text
+from models import db, Planet, Character, Vehicle
+
+SEARCHABLE = {
+    'planet': Planet,
+    'character': Character,
+    'vehicle': Vehicle,
+}
+
+# SQLite keeps one FTS5 table for the three kinds; rowid = entity id * 4 + kind code,
+# so the sync triggers and the result lookup never need to scan it
+KIND_CODES = {'planet': 1, 'character': 2, 'vehicle': 3}
+
+def sqlite_ddl():
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "name, description, tokenize='porter unicode61')"
+    ]
+    for kind, code in KIND_CODES.items():
+        row = f"new.id * 4 + {code}, new.name, new.description"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {kind}_search_insert AFTER INSERT ON {kind} BEGIN "
+            f"INSERT INTO search_index (rowid, name, description) VALUES ({row}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {kind}_search_update AFTER UPDATE OF id, name, description ON {kind} BEGIN "
+            f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code}; "
+            f"INSERT INTO search_index (rowid, name, description) VALUES ({row}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {kind}_search_delete AFTER DELETE ON {kind} BEGIN "
+            f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code}; END",
+        ]
+    return statements
+
+# the query has to repeat this exact expression for the planner to use the GIN index
+POSTGRESQL_DOCUMENT = "to_tsvector('english', name || ' ' || description)"
+
+def postgresql_ddl():
+    # expression indexes stay in sync with every write on their own
+    return [
+        f'CREATE INDEX IF NOT EXISTS ix_{kind}_search ON "{kind}" USING gin ({POSTGRESQL_DOCUMENT})'
+        for kind in SEARCHABLE
+    ]
+
+# same structures for databases built with db.create_all() instead of the migrations
+for statement in sqlite_ddl():
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in postgresql_ddl():
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+# the triggers go with their tables, but the FTS5 table would outlive db.drop_all() with stale rows
+event.listen(db.metadata, 'after_drop', DDL('DROP TABLE IF EXISTS search_index').execute_if(dialect='sqlite'))
+
+def _sqlite_match(q):
+    # quote every term so user input can't use (or break) the FTS5 query syntax
+    terms = ['"' + term.replace('"', '""') + '"' for term in q.split()]
+    return ' '.join(terms)
+
+def _search_sqlite(q, kinds, limit):
+    codes = [KIND_CODES[kind] for kind in kinds]
+    rows = db.session.execute(text(
+        "SELECT rowid, name, bm25(search_index) AS score FROM search_index "
+        "WHERE search_index MATCH :match AND rowid % 4 IN (" + ','.join(map(str, codes)) + ") "
+        "ORDER BY score LIMIT :limit"
+    ), {'match': _sqlite_match(q), 'limit': limit})
+    kind_by_code = {code: kind for kind, code in KIND_CODES.items()}
+    return [{'type': kind_by_code[row.rowid % 4], 'id': row.rowid // 4, 'name': row.name,
+             'rank': round(-row.score, 6)} for row in rows]
+
+def _search_postgresql(q, kinds, limit):
+    selects = [
+        f"SELECT '{kind}' AS kind, id, name, ts_rank({POSTGRESQL_DOCUMENT}, query) AS rank "
+        f'FROM "{kind}", websearch_to_tsquery(\'english\', :q) query '
+        f"WHERE {POSTGRESQL_DOCUMENT} @@ query"
+        for kind in kinds
+    ]
+    rows = db.session.execute(text(
+        ' UNION ALL '.join(selects) + ' ORDER BY rank DESC LIMIT :limit'
+    ), {'q': q, 'limit': limit})
+    return [{'type': row.kind, 'id': row.id, 'name': row.name, 'rank': round(row.rank, 6)} for row in rows]
+
+def _search_like(q, kinds, limit):
+    # unindexed fallback for other databases: name matches rank above description matches
+    results = []
+    pattern = f'%{q}%'
+    for kind in kinds:
+        model = SEARCHABLE[kind]
+        for obj in model.query.filter(or_(model.name.ilike(pattern), model.description.ilike(pattern))).limit(limit):
+            results.append({'type': kind, 'id': obj.id, 'name': obj.name,
+                            'rank': 1.0 if q.lower() in obj.name.lower() else 0.5})
+    results.sort(key=lambda result: -result['rank'])
+    return results[:limit]
+
+def search(q, kinds, limit):
+    """Ranked matches of q in the name and description of the given kinds."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return _search_sqlite(q, kinds, limit)
+    if dialect == 'postgresql':
+        return _search_postgresql(q, kinds, limit)
+    return _search_like(q, kinds, limit)
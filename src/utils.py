@@ -1,4 +1,12 @@
-from flask import jsonify, url_for
+import base64
+import hashlib
+import json
+from sqlalchemy import Enum, Integer, and_, or_
+from itertools import islice
+from flask import Response, current_app, jsonify, request, stream_with_context, url_for
+from cache import add_cache_tags
+from compression import compress, encodings, negotiate_encoding
+from models import counts_tag
 
 class APIException(Exception):
     status_code = 400
@@ -15,20 +23,290 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+# ids from clients must fit a BIGINT before they get near the database
+MAX_INT = 2 ** 63 - 1
+
+def is_int(value):
+    # bool is an int subclass, and json.loads() turns true into True
+    return type(value) is int and -MAX_INT - 1 <= value <= MAX_INT
+
+def encode_cursor(value):
+    raw = json.dumps(value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise APIException('Invalid cursor', status_code=400)
+
+def get_page_size():
+    default = current_app.config['PAGE_SIZE']
+    limit = request.args.get('limit', default)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise APIException('limit must be an integer', status_code=400)
+    if limit < 1:
+        raise APIException('limit must be greater than 0', status_code=400)
+    # never let a client ask for more rows than the server is willing to send
+    return min(limit, current_app.config['MAX_PAGE_SIZE'])
+
+def get_sort(model):
+    """?sort=<field> or ?sort=-<field> over the model's SORTS whitelist; defaults to id."""
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    field = sort[1:] if descending else sort
+    if field not in model.SORTS:
+        raise APIException(f'Cannot sort by {field}', status_code=400,
+                           payload={'allowed_sorts': list(model.SORTS)})
+    return field, descending
+
+def sort_order(model, field, descending):
+    columns = [getattr(model, field)] if field != 'id' else []
+    columns.append(model.id)
+    return [column.desc() for column in columns] if descending else columns
+
+def _cursor_value(model, field, value):
+    """The sort value of a cursor, which must be a scalar of the sort column's type."""
+    column = model.__table__.columns[field]
+    valid = is_int(value) if isinstance(column.type, Integer) else isinstance(value, str)
+    if not valid:
+        raise APIException('Invalid cursor', status_code=400)
+    return value
+
+def paginate(query, model):
+    """
+    Keyset pagination driven by ?limit=, ?after= and ?sort=. The cursor holds the last
+    id, or [sort value, id] when sorting by another column, so every page is an index
+    range scan no matter how deep the client goes.
+    """
+    limit = get_page_size()
+    field, descending = get_sort(model)
+    column = getattr(model, field)
+    cursor = request.args.get('after')
+    if cursor:
+        position = decode_cursor(cursor)
+        if field == 'id':
+            if not is_int(position):
+                raise APIException('Invalid cursor', status_code=400)
+            query = query.filter(model.id < position if descending else model.id > position)
+        else:
+            if not isinstance(position, list) or len(position) != 2 or not is_int(position[1]):
+                raise APIException('Invalid cursor', status_code=400)
+            value, last_id = _cursor_value(model, field, position[0]), position[1]
+            if descending:
+                query = query.filter(or_(column < value, and_(column == value, model.id < last_id)))
+            else:
+                query = query.filter(or_(column > value, and_(column == value, model.id > last_id)))
+
+    # fetch one extra row to know whether there is a next page
+    items = query.order_by(*sort_order(model, field, descending)).limit(limit + 1).all()
+    next_url = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        args = request.args.to_dict()
+        args['limit'] = limit
+        args['after'] = encode_cursor(last.id if field == 'id' else [getattr(last, field), last.id])
+        # the URL's own variables win over query args of the same name
+        next_url = url_for(request.endpoint, _external=True, **{**args, **request.view_args})
+    return items, next_url
+
+def _filter_value(model, field, value):
+    column = model.__table__.columns[field]
+    if isinstance(column.type, Enum):
+        if value not in column.type.enums:
+            raise APIException(f"{field} must be one of {', '.join(column.type.enums)}", status_code=400)
+        return value
+    if isinstance(column.type, Integer):
+        try:
+            value = int(value)
+        except ValueError:
+            raise APIException(f'{field} must be an integer', status_code=400)
+        if not is_int(value):
+            raise APIException(f'{field} must be an integer', status_code=400)
+    return value
+
+def apply_filters(query, model):
+    """
+    Equality filters (?climate=arid, ?planet_id=3) on the model's FILTERS and ranges
+    (?diameter_min=, ?diameter_max=) on its RANGE_FILTERS, all evaluated in SQL.
+    """
+    for field in model.FILTERS:
+        value = request.args.get(field)
+        if value is not None:
+            query = query.filter(getattr(model, field) == _filter_value(model, field, value))
+    for field in model.RANGE_FILTERS:
+        low = request.args.get(f'{field}_min')
+        high = request.args.get(f'{field}_max')
+        if low is not None:
+            query = query.filter(getattr(model, field) >= _filter_value(model, field, low))
+        if high is not None:
+            query = query.filter(getattr(model, field) <= _filter_value(model, field, high))
+    return query
+
+def get_ids():
+    """?ids=1,2,3 as a list of ints in request order without duplicates, or None."""
+    ids = request.args.get('ids')
+    if ids is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(id) for id in ids.split(',') if id.strip()))
+    except ValueError:
+        raise APIException('ids must be a comma separated list of integers', status_code=400)
+    if not all(is_int(id) for id in ids):
+        raise APIException('ids must be a comma separated list of integers', status_code=400)
+    if not ids:
+        raise APIException('ids must not be empty', status_code=400)
+    max_ids = current_app.config['BATCH_MAX_IDS']
+    if len(ids) > max_ids:
+        raise APIException(f'At most {max_ids} ids per request', status_code=400, payload={'max_ids': max_ids})
+    return ids
+
+def fetch_by_ids(query, model, ids):
+    """The rows of the query with these ids in one IN query, in the order asked for, and the ids not found."""
+    rows = {row.id: row for row in query.filter(model.id.in_(ids))}
+    return [rows[id] for id in ids if id in rows], [id for id in ids if id not in rows]
+
+def get_fields(model):
+    """Fields requested with ?fields=a,b,c, or None for all of them."""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    fields = tuple(dict.fromkeys(field.strip() for field in fields.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in model.FIELDS]
+    if unknown:
+        raise APIException(f"Unknown fields: {', '.join(unknown)}", status_code=400,
+                           payload={'allowed_fields': list(model.FIELDS)})
+    return fields or None
+
+def get_expand(model):
+    """Relations requested with ?expand=a,b, or an empty tuple."""
+    expand = request.args.get('expand')
+    if not expand:
+        return ()
+    names = tuple(dict.fromkeys(name.strip() for name in expand.split(',') if name.strip()))
+    unknown = [name for name in names if name not in model.EXPANSIONS]
+    if unknown:
+        raise APIException(f"Cannot expand: {', '.join(unknown)}", status_code=400,
+                           payload={'allowed_expansions': list(model.EXPANSIONS)})
+    return names
+
+def shows_counts(model, fields):
+    return 'favorite_count' in (fields or model.FIELDS)
+
+def request_tables(model):
+    """
+    For conditional_get(depends=): the versions a response reads besides its route's own
+    tables, from ?fields= and ?expand=: the favorite counts it shows and the relations
+    it nests (whose rows carry their counts too).
+    """
+    def tables():
+        names = {counts_tag(model)} if shows_counts(model, get_fields(model)) else set()
+        for name in get_expand(model):
+            related = model.EXPANSIONS[name][0]
+            names.update((related.__tablename__, counts_tag(related)))
+        return names
+    return tables
+
+def expansion_columns(model, names):
+    """The extra columns model.row_query() selects so expand_rows() can look up these relations."""
+    return {f'{name}_key': getattr(model, model.EXPANSIONS[name][1]) for name in names}
+
+def expand_rows(model, rows, fields, names):
+    """
+    Rows of model.row_query(fields, expansion_columns()) as dicts, with each relation in
+    names nested under its own key. A relation costs one IN query whatever the number of
+    rows; to-many relations are lists ordered by id.
+    """
+    fields = fields or model.FIELDS
+    count = len(fields)
+    items = [dict(zip(fields, row[:count])) for row in rows]
+    for name in names:
+        related, _, remote_key, many = model.EXPANSIONS[name]
+        label = f'{name}_key'
+        keys = {getattr(row, label) for row in rows} - {None}
+        nested = {}
+        if keys:
+            remote = getattr(related, remote_key)
+            query = related.row_query(related.query.filter(remote.in_(keys)), extra={'expand_key': remote}) \
+                .order_by(related.id)
+            serialize = related.row_serializer()
+            for related_row in query:
+                if many:
+                    nested.setdefault(related_row.expand_key, []).append(serialize(related_row))
+                else:
+                    nested[related_row.expand_key] = serialize(related_row)
+        for item, row in zip(items, rows):
+            item[name] = nested.get(getattr(row, label), [] if many else None)
+        add_cache_tags(related.__tablename__, counts_tag(related))
+    return items
+
+def serialize_rows(model, rows, fields=None, expand=()):
+    """Rows of a list route, as dataclasses or, with relations to nest, as expand_rows() dicts."""
+    if shows_counts(model, fields):
+        add_cache_tags(counts_tag(model))
+    if expand:
+        return expand_rows(model, rows, fields, expand)
+    return model.serialize_rows(rows, fields)
+
+def wants_ndjson():
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def stream_ndjson(query, model, fields=None, expand=(), ids=None):
+    """
+    Full export, one JSON document per line, read through a server-side cursor in batches.
+    The query is a model.row_query(), so rows never become model instances; with expand,
+    relations are loaded once per batch. With ids (from get_ids()), only those rows.
+    """
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    query = query.order_by(*sort_order(model, *get_sort(model))) \
+        .execution_options(stream_results=True) \
+        .yield_per(batch_size)
+
+    def generate():
+        dumps = current_app.json.dumps
+        if not expand:
+            serialize = model.row_serializer(fields)
+            for row in query:
+                yield dumps(serialize(row)) + '\n'
+            return
+        rows = iter(query)
+        while batch := list(islice(rows, batch_size)):
+            for item in expand_rows(model, batch, fields, expand):
+                yield dumps(item) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
+def route_table(app):
+    """Every API route with its methods and URL parameters, read from the rules (no url_for)."""
+    routes = {}
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static' or rule.rule.startswith('/admin'):
+            continue
+        route = routes.setdefault(rule.rule, {'path': rule.rule, 'methods': set(), 'parameters': sorted(rule.arguments)})
+        route['methods'].update(rule.methods - {'HEAD', 'OPTIONS'})
+    return [{**route, 'methods': sorted(route['methods'])} for _, route in sorted(routes.items())]
+
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = ['/admin/'] if app.config.get('ADMIN_MODE') != 'off' else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
         if "GET" in rule.methods and has_no_empty_params(rule):
-            url = url_for(rule.endpoint, **(rule.defaults or {}))
-            if "/admin/" not in url:
-                links.append(url)
+            if not rule.rule.startswith("/admin/") and rule.endpoint != 'static':
+                links.append(rule.rule)
 
     links_html = "".join(["<li><a href='" + y + "'>" + y + "</a></li>" for y in links])
     return """
@@ -39,3 +317,42 @@ def generate_sitemap(app):
         <p>Start working on your proyect by following the <a href="https://start.4geeksacademy.com/starters/flask" target="_blank">Quick Start</a></p>
         <p>Remember to specify a real endpoint path like: </p>
         <ul style="text-align: left;">"""+links_html+"</ul></div>"
+
+class Sitemap:
+    """
+    The HTML sitemap and the JSON route table, rendered once when the app is finalized
+    (after its last route) and served from memory with an ETag and Cache-Control. Bodies
+    are compressed up front in every encoding the compression hook would use, and each
+    encoding gets its own ETag, as conditional_get() does.
+    """
+
+    def __init__(self, app):
+        html = generate_sitemap(app).encode()
+        routes = app.json.dumps({'routes': route_table(app)}).encode()
+        self.etag = hashlib.sha1(html + routes).hexdigest()
+        self.max_age = app.config['SITEMAP_MAX_AGE']
+        self.bodies = {'html': {None: html}, 'json': {None: routes}}
+        if app.config.get('COMPRESS_ENABLED'):
+            with app.app_context():
+                for encoded in self.bodies.values():
+                    if len(encoded[None]) >= app.config['COMPRESS_MIN_SIZE']:
+                        encoded.update((encoding, compress(encoded[None], encoding)) for encoding in encodings())
+
+    def response(self, kind, mimetype):
+        encoding = negotiate_encoding()
+        if encoding not in self.bodies[kind]:
+            encoding = None
+        response = Response(self.bodies[kind][encoding], mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(f'{self.etag}-{encoding}' if encoding else self.etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.max_age
+        return response.make_conditional(request)
+
+    def html_response(self):
+        return self.response('html', 'text/html')
+
+    def json_response(self):
+        return self.response('json', 'application/json')
@@ -0,0 +1,48 @@
+"""
+The tests run the app against a throwaway SQLite database, reseeded for every test
+through benchmarks/seed.py:
+
+    $ pip install pytest
+    $ python -m pytest
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# read when app.py is imported, so set before the first import below
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['QUERY_LOG_ENABLED'] = '1'
+os.environ['SLOW_QUERY_MS'] = '0'
+os.environ.pop('DATABASE_READ_URL', None)
+os.environ.pop('CACHE_URL', None)
+
+import pytest
+import seed as seeding
+from app import app as flask_app
+from cache import response_cache
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    seeding.seed(flask_app.config['SQLALCHEMY_DATABASE_URI'], planets=0, characters=0, vehicles=0, users=0,
+                 favorites=0)
+    response_cache.backend.clear()
+    yield flask_app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def seed(app):
+    """Reseed the database with these volumes (see benchmarks/seed.py) and empty the cache."""
+    def reseed(**volumes):
+        volumes = {'planets': 0, 'characters': 0, 'vehicles': 0, 'users': 1, 'favorites': 0, **volumes}
+        seeded = seeding.seed(app.config['SQLALCHEMY_DATABASE_URI'], **volumes)
+        response_cache.backend.clear()
+        return seeded
+    return reseed
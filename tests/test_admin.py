@@ -0,0 +1,26 @@
+from cache import SQLiteBackend, response_cache
+from models import db, Planet
+
+def test_standalone_admin_edits_invalidate_the_shared_cache(app, seed, monkeypatch, tmp_path):
+    from admin import create_admin_app
+    seed(planets=1)
+    path = str(tmp_path / 'cache.db')
+    monkeypatch.setenv('CACHE_URL', 'sqlite:///' + path)
+    api_backend = response_cache.backend
+    try:
+        admin_app = create_admin_app(standalone=True)
+        # what an API worker on the same CACHE_URL sees
+        shared = SQLiteBackend(path)
+        before = shared.counters(['tag:planet', 'tag:planet:1'])
+        with admin_app.app_context():
+            db.session.get(Planet, 1).name = 'Renamed'
+            db.session.commit()
+        assert shared.counters(['tag:planet', 'tag:planet:1']) == [version + 1 for version in before]
+    finally:
+        response_cache.backend = api_backend
+
+def test_admin_inside_the_api_keeps_its_cache(app):
+    from admin import create_admin_app
+    backend = response_cache.backend
+    create_admin_app()
+    assert response_cache.backend is backend
@@ -0,0 +1,26 @@
+import json
+import pytest
+
+def test_ids_come_back_in_request_order_with_the_missing_ones(client, seed):
+    seed(planets=5)
+    body = client.get('/planets?ids=4,2,99,4').get_json()
+    assert [planet['id'] for planet in body['results']] == [4, 2]
+    assert body['missing'] == [99]
+
+@pytest.mark.parametrize('ids', ['1,x', '99999999999999999999999', '-99999999999999999999999', ','])
+def test_invalid_ids_are_a_400(client, seed, ids):
+    seed(planets=5)
+    assert client.get(f'/planets?ids={ids}').status_code == 400
+
+def test_too_many_ids_is_a_400(app, client, seed):
+    seed(planets=5)
+    ids = ','.join(str(id) for id in range(1, app.config['BATCH_MAX_IDS'] + 2))
+    assert client.get(f'/planets?ids={ids}').status_code == 400
+
+@pytest.mark.parametrize('path, headers', [('/characters?ids=3,1&stream=1', {}),
+                                           ('/characters?ids=3,1', {'Accept': 'application/x-ndjson'})])
+def test_streaming_keeps_to_the_ids(client, seed, path, headers):
+    seed(planets=1, characters=5)
+    response = client.get(path, headers=headers)
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()] == [1, 3]
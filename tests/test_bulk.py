@@ -0,0 +1,53 @@
+import json
+from models import db, Planet
+
+def planet(name, **overrides):
+    return {'name': name, 'terrain': 'ocean', 'climate': 'murky', 'population': '0', 'orbital_period': 1,
+            'rotation_period': 1, 'diameter': 1, 'description': '', **overrides}
+
+def test_upsert_reports_every_item(app, client, seed):
+    seed(planets=2)
+    items = [planet('planet1', diameter=42), planet('Kamino'), planet('Bad', climate='windy'), 'not an object',
+             planet('Mute', terrain=None)]
+    body = client.post('/planets/bulk?chunk_size=2', json=items).get_json()
+    assert body['counts'] == {'updated': 1, 'created': 1, 'error': 3}
+    assert [(result['index'], result['status']) for result in body['results']] == [
+        (0, 'updated'), (1, 'created'), (2, 'error'), (3, 'error'), (4, 'error')]
+    assert body['results'][0]['id'] == 1
+    assert body['results'][2]['error'].startswith('climate must be one of')
+    assert body['results'][3]['error'] == 'Item must be a JSON object'
+    assert body['results'][4]['error'] == 'terrain is required'
+    with app.app_context():
+        assert db.session.get(Planet, 1).diameter == 42
+        assert Planet.query.count() == 3
+
+def test_a_rejected_chunk_is_retried_item_by_item(app, client, seed):
+    seed(planets=0)
+    with app.app_context():
+        db.session.execute(db.text("CREATE TRIGGER no_alderaan BEFORE INSERT ON planet WHEN NEW.name = 'Alderaan' "
+                                   "BEGIN SELECT RAISE(ABORT, 'destroyed'); END"))
+        db.session.commit()
+    body = client.post('/planets/bulk', json=[planet('Hoth'), planet('Alderaan'), planet('Yavin')]).get_json()
+    assert [result['status'] for result in body['results']] == ['created', 'error', 'created']
+    assert body['results'][1]['error'] == 'Rejected by the database'
+    assert client.get('/planets?fields=name').get_json()['results'] == [{'name': 'Hoth'}, {'name': 'Yavin'}]
+
+def test_ndjson_stream(client, seed):
+    seed(planets=0)
+    lines = '\n'.join([json.dumps(planet('Dagobah')), '{broken', '', json.dumps(planet('Endor'))])
+    body = client.post('/planets/bulk', data=lines, content_type='application/x-ndjson').get_json()
+    assert body['counts'] == {'created': 2, 'error': 1}
+    assert body['results'][1] == {'index': 1, 'name': None, 'status': 'error', 'error': 'Invalid JSON on line 2'}
+
+def test_delete_reports_every_id(client, seed):
+    seed(planets=3)
+    body = client.delete('/planets/bulk?chunk_size=2', json=[1, 7, 'x', True, 3]).get_json()
+    assert [result['status'] for result in body['results']] == ['deleted', 'not_found', 'error', 'error', 'deleted']
+    assert client.get('/planets/2').status_code == 200
+    assert client.get('/planets/3').status_code == 404
+
+def test_body_and_chunk_size_are_validated(client, seed):
+    seed(planets=0)
+    assert client.post('/planets/bulk', json={'name': 'x'}).status_code == 400
+    assert client.post('/planets/bulk?chunk_size=0', json=[]).status_code == 400
+    assert client.post('/planets/bulk?chunk_size=many', json=[]).status_code == 400
@@ -0,0 +1,74 @@
+import os
+import runpy
+import tempfile
+from cache import ROW_TAG_LIMIT, response_cache
+from models import db, Planet
+
+def served_from_cache(client, path):
+    hits = response_cache.hits
+    assert client.get(path).status_code == 200
+    return response_cache.hits > hits
+
+def planet_body(name):
+    return {'name': name, 'terrain': 'ocean', 'climate': 'murky', 'population': '0', 'orbital_period': 1,
+            'rotation_period': 1, 'diameter': 1, 'description': '', 'image_url': None}
+
+def test_a_write_drops_only_the_entries_depending_on_it(client, seed):
+    # characters 2 and 5 live on planet 3, characters 1 and 4 on planet 2
+    seed(planets=3, characters=6, vehicles=2)
+    paths = ['/planets', '/planets/3', '/planets/2', '/characters', '/characters/2', '/characters/1', '/vehicles']
+    for path in paths:
+        served_from_cache(client, path)
+
+    assert client.put('/planets/3', json=planet_body('Renamed')).status_code == 200
+    assert {path: served_from_cache(client, path) for path in paths} == {
+        '/planets': False, '/planets/3': False, '/planets/2': True,
+        '/characters': False, '/characters/2': False, '/characters/1': True,
+        '/vehicles': True,
+    }
+    assert client.get('/characters/2').get_json()['homeworld'] == 'Renamed'
+
+def test_a_rolled_back_write_invalidates_nothing(app, client, seed):
+    seed(planets=2)
+    served_from_cache(client, '/planets/1')
+    with app.app_context():
+        db.session.get(Planet, 1).name = 'Never committed'
+        db.session.flush()
+        db.session.rollback()
+    assert served_from_cache(client, '/planets/1')
+
+def test_a_large_write_drops_every_row_of_the_table_at_once(client, seed):
+    seed(planets=ROW_TAG_LIMIT + 10, characters=1, vehicles=1)
+    served_from_cache(client, '/planets/1')
+    served_from_cache(client, '/vehicles/1')
+    items = [planet_body(f'planet{i}') for i in range(2, ROW_TAG_LIMIT + 10)]
+    assert client.post('/planets/bulk', json=items).get_json()['counts'] == {'updated': len(items)}
+    # planet 1 itself wasn't written, but the commit bumped 'planet:*' rather than each row
+    assert not served_from_cache(client, '/planets/1')
+    assert served_from_cache(client, '/vehicles/1')
+
+def test_zero_ttl_turns_the_cache_off(client, seed, monkeypatch):
+    seed(planets=1)
+    monkeypatch.setattr(response_cache, 'ttl', 0)
+    served_from_cache(client, '/planets/1')
+    assert not served_from_cache(client, '/planets/1')
+    assert response_cache.backend.size() == 0
+
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'gunicorn.conf.py')
+
+def gunicorn_env(monkeypatch, **env):
+    """The environment the workers get from gunicorn.conf.py, given this one."""
+    environ = {'WEB_CONCURRENCY': '3', **env}
+    monkeypatch.setattr(os, 'environ', environ)
+    runpy.run_path(GUNICORN_CONF)
+    return environ
+
+def test_workers_share_a_sqlite_cache_by_default(monkeypatch):
+    environ = gunicorn_env(monkeypatch)
+    assert environ['CACHE_URL'] == f'sqlite:///{tempfile.gettempdir()}/api-cache-{os.getpid()}.db'
+    assert 'CACHE_TTL' not in environ
+
+def test_a_per_process_cache_is_off_with_several_workers(monkeypatch):
+    assert gunicorn_env(monkeypatch, CACHE_URL='memory://')['CACHE_TTL'] == '0'
+    assert 'CACHE_TTL' not in gunicorn_env(monkeypatch, CACHE_URL='memory://', WEB_CONCURRENCY='1')
+    assert 'CACHE_TTL' not in gunicorn_env(monkeypatch, CACHE_URL='redis://cache:6379/0')
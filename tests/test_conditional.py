@@ -0,0 +1,38 @@
+CHARACTER = {'name': 'Tester', 'gender': 'n/a', 'birth_year': '0', 'height': 1, 'hair_color': 'none',
+             'eye_color': 'none', 'description': 'test', 'image_url': None, 'planet_id': 1}
+
+def etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+def test_unchanged_payload_is_a_304(client, seed):
+    seed(planets=3)
+    tag = etag(client, '/planets')
+    response = client.get('/planets', headers={'If-None-Match': tag})
+    assert response.status_code == 304
+
+def test_write_changes_the_etag_of_its_table_only(client, seed):
+    seed(planets=3, vehicles=0)
+    planets, vehicles = etag(client, '/planets'), etag(client, '/vehicles')
+    client.post('/planets', json={'name': 'New', 'terrain': 't', 'climate': 'arid', 'population': '0',
+                                  'orbital_period': 1, 'rotation_period': 1, 'diameter': 1, 'description': 'd'})
+    assert etag(client, '/planets') != planets
+    assert etag(client, '/vehicles') == vehicles
+
+def test_expanded_tables_count_only_when_expanded(client, seed):
+    seed(planets=3, characters=3)
+    paths = ['/planets', '/planets/1', '/planets?expand=residents', '/planets/1?expand=residents']
+    before = {path: etag(client, path) for path in paths}
+    assert client.post('/characters', json=CHARACTER).status_code == 200
+    after = {path: etag(client, path) for path in paths}
+    assert after['/planets'] == before['/planets']
+    assert after['/planets/1'] == before['/planets/1']
+    assert after['/planets?expand=residents'] != before['/planets?expand=residents']
+    assert after['/planets/1?expand=residents'] != before['/planets/1?expand=residents']
+
+def test_unknown_expansion_is_a_400(client, seed):
+    seed(planets=1)
+    response = client.get('/planets?expand=moons')
+    assert response.status_code == 400
+    assert response.get_json()['allowed_expansions'] == ['residents']
@@ -0,0 +1,129 @@
+import re
+from sqlalchemy import event
+from models import db, Character, Favorites, Planet, TableVersion, Vehicle, bump_table_versions
+
+def counts(app, model):
+    with app.app_context():
+        return dict(db.session.query(model.id, model.favorite_count).order_by(model.id).all())
+
+def favorite(client, user_id, **entity):
+    return client.post(f'/favorites/user/{user_id}', json=entity)
+
+def test_counters_follow_adds_and_deletes(app, client, seed):
+    seed(planets=3, characters=3, users=2)
+    assert favorite(client, 1, planet_id=2).status_code == 200
+    assert favorite(client, 2, planet_id=2).status_code == 200
+    assert favorite(client, 2, planet_id=2).status_code == 409
+    assert counts(app, Planet) == {1: 0, 2: 2, 3: 0}
+    assert client.get('/planets/2').get_json()['favorite_count'] == 2
+
+    assert client.delete('/favorites/users/1/planet/2').status_code == 200
+    assert counts(app, Planet) == {1: 0, 2: 1, 3: 0}
+    assert client.get('/planets/2').get_json()['favorite_count'] == 1
+
+def test_leaderboard(client, seed):
+    seed(planets=3, users=3)
+    for user_id in (1, 2, 3):
+        favorite(client, user_id, planet_id=3)
+    favorite(client, 1, planet_id=1)
+    body = client.get('/favorites/top?type=planet&fields=id,favorite_count').get_json()
+    assert body['results'] == [{'id': 3, 'favorite_count': 3}, {'id': 1, 'favorite_count': 1}]
+    assert client.get('/favorites/top?type=moon').status_code == 400
+
+def test_deleting_an_entity_uncounts_what_its_favorites_also_pointed_at(app, client, seed):
+    seed(planets=2, characters=2, vehicles=2, users=1)
+    favorite(client, 1, character_id=1, planet_id=2)
+    favorite(client, 1, vehicle_id=1)
+    assert client.delete('/characters/1').status_code == 200
+    assert counts(app, Planet) == {1: 0, 2: 0}
+    assert client.delete('/vehicles/bulk', json=[1, 2]).get_json()['counts'] == {'deleted': 2}
+    with app.app_context():
+        assert Favorites.query.count() == 0
+
+def test_reconcile_repairs_drift(app, client, seed):
+    seed(planets=2, characters=2, vehicles=2, users=1)
+    favorite(client, 1, vehicle_id=2)
+    with app.app_context():
+        db.session.execute(db.text('UPDATE vehicle SET favorite_count = 7 WHERE id = 1'))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['reconcile-favorites'])
+    assert 'vehicle: 1 fixed' in result.output
+    assert counts(app, Vehicle) == {1: 0, 2: 1}
+    assert counts(app, Character) == {1: 0, 2: 0}
+
+def written_rows(app, client, method, path, **kwargs):
+    """The rows a request writes, in order: table_version rows by name, other tables by name."""
+    rows = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        match = re.match(r'(UPDATE|INSERT INTO|DELETE FROM) "?(\w+)', statement)
+        if match:
+            table = match.group(2)
+            rows.append(f'version:{parameters[-1]}' if table == 'table_version' and match.group(1) == 'UPDATE'
+                        else table)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert getattr(client, method)(path, **kwargs).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return rows
+
+def test_add_and_delete_lock_rows_in_the_same_order(app, client, seed):
+    seed(planets=2, users=2)
+    favorite(client, 1, planet_id=1)
+    added = written_rows(app, client, 'post', '/favorites/user/2', json={'planet_id': 1})
+    deleted = written_rows(app, client, 'delete', '/favorites/users/1/planet/1')
+    assert [row for row in added if row != 'favorites'] == [row for row in deleted if row != 'favorites']
+    assert added.index('version:favorites') < added.index('planet')
+    assert deleted.index('version:favorites') < deleted.index('planet')
+
+def test_a_favorite_only_touches_the_responses_showing_its_count(client, seed):
+    from cache import response_cache
+    seed(planets=5, characters=5, vehicles=5, users=1)
+    # vehicle 3 is flown by character 4; vehicles are also tagged with their pilot's row
+    unchanged = ['/planets', '/vehicles', '/vehicles/3', '/search?q=galaxy', '/characters?fields=id,name']
+    changed = ['/characters', '/characters/1', '/favorites/top?type=character', '/planets?expand=residents']
+    # another character's count didn't move: its validator follows the table-wide count
+    # version, but the cached body, tagged with its own row, stays
+    other = '/characters/2'
+    before = {path: client.get(path).headers['ETag'] for path in unchanged + changed + [other]}
+
+    assert favorite(client, 1, character_id=1).status_code == 200
+    hits = response_cache.hits
+    after = {path: client.get(path) for path in unchanged + changed + [other]}
+    for path in unchanged:
+        assert after[path].headers['ETag'] == before[path], path
+    for path in changed:
+        assert after[path].headers['ETag'] != before[path], path
+    assert response_cache.hits - hits == len(unchanged) + 1
+    assert after['/characters/1'].get_json()['favorite_count'] == 1
+    assert after['/characters'].get_json()['results'][0]['favorite_count'] == 1
+
+class RacingConnection:
+    """Lets a concurrent transaction create the version row right after the first UPDATE missed it."""
+
+    def __init__(self, connection, engine, name):
+        self.connection, self.engine, self.name = connection, engine, name
+        self.raced = False
+
+    def __getattr__(self, attribute):
+        return getattr(self.connection, attribute)
+
+    def execute(self, statement, *args, **kwargs):
+        result = self.connection.execute(statement, *args, **kwargs)
+        if not self.raced:
+            self.raced = True
+            with self.engine.begin() as other:
+                bump_table_versions(other, [self.name])
+        return result
+
+def test_concurrent_first_bumps_of_a_version_both_count(app, seed):
+    seed()
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as connection:
+            bump_table_versions(RacingConnection(connection, engine, 'character_favorites'), ['character_favorites'])
+        assert TableVersion.query.get('character_favorites').version == 2
@@ -0,0 +1,19 @@
+import pytest
+
+def test_filters_and_ranges(client, seed):
+    # character i lives on planet i % 3 + 1 and is 100 + i tall
+    seed(planets=3, characters=9)
+    items = client.get('/characters?planet_id=2&height_min=104').get_json()['results']
+    assert [item['id'] for item in items] == [4, 7]
+
+@pytest.mark.parametrize('path', [
+    '/characters?height_min=99999999999999999999',
+    '/planets?diameter_max=-99999999999999999999',
+    '/characters?planet_id=99999999999999999999',
+    '/characters?planet_id=two',
+])
+def test_integer_filters_out_of_range_are_a_400(client, seed, path):
+    seed(planets=1, characters=1)
+    response = client.get(path)
+    assert response.status_code == 400
+    assert response.get_json()['message'].endswith('must be an integer')
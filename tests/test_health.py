@@ -0,0 +1,21 @@
+from sqlalchemy.exc import OperationalError
+import app as api
+
+def test_db_health_reports_the_pool(client, seed):
+    seed()
+    body = client.get('/health/db').get_json()
+    assert body['status'] == 'ok'
+    assert 'pool' in body
+
+def test_db_health_failure_keeps_the_error_in_the_logs(client, seed, monkeypatch, caplog):
+    seed()
+
+    def unreachable(engine):
+        raise OperationalError('SELECT 1', {}, Exception('could not connect to db.internal:5432 as admin'))
+
+    monkeypatch.setattr(api, 'check_database', unreachable)
+    response = client.get('/health/db')
+    assert response.status_code == 503
+    assert set(response.get_json()) == {'status', 'pool', 'replicas'}
+    assert b'db.internal' not in response.data
+    assert 'db.internal' in caplog.text
@@ -0,0 +1,29 @@
+from datetime import datetime
+import pytest
+import json_provider
+from models import Planet, row_type
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def provider(app, request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    return app.json
+
+def payload():
+    row = row_type(Planet, ('name', 'id', 'diameter'))(name='Hoth', id=4, diameter=7200)
+    return {'results': [row], 'next': None, 'at': datetime(2026, 10, 18, 12, 0)}
+
+def body(provider):
+    # a response, which is compact on both paths
+    return provider.response(payload()).get_data(as_text=True).rstrip('\n')
+
+def test_both_paths_keep_field_order(provider):
+    assert body(provider) == \
+        '{"results":[{"name":"Hoth","id":4,"diameter":7200}],"next":null,"at":"Sun, 18 Oct 2026 12:00:00 GMT"}'
+
+def test_both_paths_sort_alike_when_asked(provider, monkeypatch):
+    monkeypatch.setattr(provider, 'sort_keys', True)
+    assert body(provider) == \
+        '{"at":"Sun, 18 Oct 2026 12:00:00 GMT","next":null,"results":[{"diameter":7200,"id":4,"name":"Hoth"}]}'
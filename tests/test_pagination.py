@@ -0,0 +1,54 @@
+import pytest
+from utils import encode_cursor
+
+def walk(client, path):
+    """Every item of a paginated list, following the next links."""
+    items = []
+    while path:
+        body = client.get(path).get_json()
+        items += body['results']
+        path = body['next']
+    return items
+
+def test_pages_cover_every_row_once(client, seed):
+    seed(characters=23)
+    items = walk(client, '/characters?limit=5')
+    assert [item['id'] for item in items] == list(range(1, 24))
+
+def test_descending_sort_on_another_column(client, seed):
+    seed(characters=23)
+    items = walk(client, '/characters?limit=4&sort=-height')
+    keys = [(item['height'], item['id']) for item in items]
+    assert keys == sorted(keys, reverse=True)
+    assert len(keys) == 23
+
+@pytest.mark.parametrize('position', [True, 'abc', 2 ** 64, -2 ** 64, 1.5, None, [1, 2]])
+def test_invalid_id_cursor_is_a_400(client, seed, position):
+    seed(characters=3)
+    response = client.get(f'/characters?after={encode_cursor(position)}')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid cursor'
+
+@pytest.mark.parametrize('position', [[100, True], [100, 2 ** 64], [100], 'x'])
+def test_invalid_sort_cursor_is_a_400(client, seed, position):
+    seed(characters=3)
+    response = client.get(f'/characters?sort=height&after={encode_cursor(position)}')
+    assert response.status_code == 400
+
+def test_undecodable_cursor_is_a_400(client, seed):
+    seed(characters=3)
+    assert client.get('/characters?after=%%%').status_code == 400
+
+@pytest.mark.parametrize('sort, value', [('name', {'a': 1}), ('name', 5), ('height', 'tall'), ('height', [1]),
+                                         ('height', 1.5), ('name', None)])
+def test_sort_value_of_the_wrong_type_is_a_400(client, seed, sort, value):
+    seed(characters=3)
+    response = client.get(f'/characters?sort={sort}&after={encode_cursor([value, 3])}')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == 'Invalid cursor'
+
+def test_next_link_keeps_the_url_variables(client, seed):
+    # vehicle i is flown by character i % 2 + 1
+    seed(characters=2, vehicles=6)
+    items = walk(client, '/characters/1/vehicles?limit=1&character_id=2')
+    assert [item['id'] for item in items] == [2, 4, 6]
@@ -0,0 +1,31 @@
+from sqlalchemy import event
+from models import db
+
+def count_queries(app, client, path):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements)
+
+def counts_at(app, client, seed, paths, **volumes):
+    seed(**volumes)
+    return {path: count_queries(app, client, path) for path in paths}
+
+def test_reads_run_the_same_queries_at_ten_times_the_rows(app, client, seed):
+    # one user holding every favorite, so the favorites list grows with the volumes too;
+    # query_budget() raises QueryBudgetExceeded under app.testing as well
+    paths = ['/characters', '/vehicles', '/planets', '/users', '/users/1/favorites',
+             '/characters/1', '/vehicles/1', '/characters?expand=homeworld,vehicles']
+    small = counts_at(app, client, seed, paths, planets=10, characters=20, vehicles=20, favorites=30)
+    large = counts_at(app, client, seed, paths, planets=100, characters=200, vehicles=200, favorites=300)
+    assert small == large
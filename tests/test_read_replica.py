@@ -0,0 +1,57 @@
+"""
+Read/write routing against two SQLite files: the test database as the primary and a
+copy whose planet names say 'replica', registered as a replica bind the way
+DATABASE_READ_URL would.
+"""
+import pytest
+import seed as seeding
+from sqlalchemy import create_engine
+from cache import response_cache
+from database import REPLICA_PREFIX
+from models import db, Planet
+
+@pytest.fixture
+def replica(app, seed, tmp_path):
+    seed(planets=2)
+    url = 'sqlite:///' + str(tmp_path / 'replica.db')
+    seeding.seed(url, planets=2, characters=0, vehicles=0, users=1, favorites=0)
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE planet SET name = 'replica ' || name")
+    with app.app_context():
+        db.engines[f'{REPLICA_PREFIX}0'] = engine
+    yield engine
+    with app.app_context():
+        db.engines.pop(f'{REPLICA_PREFIX}0')
+    engine.dispose()
+
+def planet_names(engine):
+    with engine.connect() as connection:
+        return [name for name, in connection.exec_driver_sql('SELECT name FROM planet ORDER BY id')]
+
+def test_gets_read_from_the_replica(client, replica, monkeypatch):
+    # uncached: cache misses are built on the primary (see below)
+    monkeypatch.setattr(response_cache, 'ttl', 0)
+    assert client.get('/planets/1').get_json()['name'] == 'replica planet1'
+
+def test_writes_go_to_the_primary(app, client, replica):
+    body = {'name': 'Written', 'terrain': 'ocean', 'climate': 'murky', 'population': '0', 'orbital_period': 1,
+            'rotation_period': 1, 'diameter': 1, 'description': ''}
+    assert client.post('/planets', json={**body, 'name': 'Posted'}).status_code == 200
+    assert client.put('/planets/1', json=body).status_code == 200
+    with app.app_context():
+        assert planet_names(db.engine) == ['Written', 'planet2', 'Posted']
+    assert planet_names(replica) == ['replica planet1', 'replica planet2']
+
+def test_reads_after_a_write_stay_on_the_primary(app, replica):
+    with app.test_request_context('/planets', method='GET'):
+        assert db.session.get(Planet, 1).name == 'replica planet1'
+        db.session.expunge_all()
+        db.session.get(Planet, 2).name = 'Renamed'
+        db.session.flush()
+        assert db.session.get(Planet, 1).name == 'planet1'
+        db.session.rollback()
+
+def test_cache_misses_are_built_on_the_primary(client, replica):
+    assert response_cache.ttl > 0
+    assert client.get('/planets/1').get_json()['name'] == 'planet1'
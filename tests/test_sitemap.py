@@ -0,0 +1,26 @@
+import gzip
+import pytest
+
+@pytest.mark.parametrize('path', ['/', '/sitemap.json'])
+def test_each_encoding_has_its_own_etag(client, path):
+    identity = client.get(path, headers={'Accept-Encoding': 'identity'})
+    gzipped = client.get(path, headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped.data) == identity.data
+    assert gzipped.headers['ETag'] != identity.headers['ETag']
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+
+    # a gzip validator doesn't match the identity representation, and vice versa
+    assert client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']}).status_code == 304
+    assert client.get(path, headers={'Accept-Encoding': 'identity',
+                                     'If-None-Match': gzipped.headers['ETag']}).status_code == 200
+    assert client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': identity.headers['ETag']}).status_code == 200
+
+def test_bodies_are_compressed_once(client, monkeypatch):
+    import compression
+
+    def fail(*args):
+        raise AssertionError('compressed on a hit')
+
+    monkeypatch.setattr(compression, 'compress', fail)
+    assert client.get('/', headers={'Accept-Encoding': 'gzip'}).headers['Content-Encoding'] == 'gzip'